@@ -1,9 +1,15 @@
 from datetime import datetime, timedelta
+import json
+import math
+import os
+import time
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 # --- Configuration ---
 PEAK_RATE_PER_KWH = 10.0
 OFF_PEAK_RATE_PER_KWH = 5.0
+STANDARD_RATE_PER_KWH = 7.5
 
 # Define typical run times (in hours) for different appliance types
 APPLIANCE_CYCLE_LENGTHS = {
@@ -19,6 +25,157 @@ APPLIANCE_CYCLE_LENGTHS = {
     'Default': 1
 }
 
+def make_tariff(rates_by_hours, default_rate):
+    """
+    Builds a 24-entry array of rates per kWh, one per hour of the day.
+    `rates_by_hours` maps (start_hour, end_hour) ranges to a rate; ranges may
+    wrap past midnight, e.g. (22, 6).
+    """
+    tariff = np.full(24, default_rate, dtype=np.float64)
+    for (start, end), rate in rates_by_hours.items():
+        hours = np.arange(start, end if end > start else end + 24) % 24
+        tariff[hours] = rate
+    return tariff
+
+def load_tariff_plans(path):
+    """
+    Reads tariff plans from a JSON file mapping plan name to either 24 hourly
+    rates, or {"default": rate, "rates": [[start_hour, end_hour, rate], ...]}
+    in the form make_tariff takes. Raises ValueError for a malformed plan.
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    if not isinstance(specs, dict):
+        raise ValueError(f"{path}: expected an object of tariff plans")
+    plans = {}
+    for name, spec in specs.items():
+        try:
+            if isinstance(spec, dict):
+                tariff = make_tariff({(int(start), int(end)): float(rate) for start, end, rate in spec.get('rates', [])},
+                                     float(spec['default']))
+            else:
+                tariff = np.array([float(rate) for rate in spec], dtype=np.float64)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path}: invalid tariff plan {name!r}: {e}")
+        if tariff.shape != (24,) or not all(math.isfinite(rate) and rate >= 0 for rate in tariff):
+            raise ValueError(f"{path}: tariff plan {name!r} needs 24 finite, non-negative hourly rates")
+        plans[name] = tariff
+    return plans
+
+# Hourly time-of-use tariff plans (rate per kWh for each hour of the day).
+# ECOWISE_TARIFF_PLANS names a JSON file of plans to add or replace (see
+# load_tariff_plans); it is read here so worker processes get the same plans.
+TARIFF_PLANS = {
+    'time_of_use': make_tariff({(6, 22): PEAK_RATE_PER_KWH}, OFF_PEAK_RATE_PER_KWH),
+    'evening_peak': make_tariff({(18, 22): PEAK_RATE_PER_KWH, (22, 6): OFF_PEAK_RATE_PER_KWH}, STANDARD_RATE_PER_KWH),
+    'flat': make_tariff({}, STANDARD_RATE_PER_KWH),
+}
+if os.environ.get('ECOWISE_TARIFF_PLANS'):
+    TARIFF_PLANS.update(load_tariff_plans(os.environ['ECOWISE_TARIFF_PLANS']))
+DEFAULT_TARIFF = os.environ.get('ECOWISE_DEFAULT_TARIFF', 'time_of_use')
+if DEFAULT_TARIFF not in TARIFF_PLANS:
+    raise ValueError(f"ECOWISE_DEFAULT_TARIFF names an unknown tariff plan: {DEFAULT_TARIFF!r}")
+
+# Household connection limit the joint schedule keeps total load under
+DEFAULT_PEAK_KW = 7.0
+
+# --- Window search engine ---
+# Everything below works on the last axis, so a single forecast, many
+# appliances (2-D) or many tariffs x appliances (3-D) are scored in one call.
+
+def window_sums(values, window_sizes):
+    """
+    Sums of every `window_size`-long window along the last axis, via prefix sums
+    (O(n) regardless of window size). `window_sizes` is a scalar or one size per
+    row. Entry [..., s] is the window starting at s; windows running past the
+    end are +inf.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    horizon = values.shape[-1]
+    window_sizes = np.asarray(window_sizes)
+    shape = np.broadcast_shapes(values.shape[:-1], window_sizes.shape) + (horizon,)
+    prefix = np.zeros(values.shape[:-1] + (horizon + 1,))
+    np.cumsum(values, axis=-1, out=prefix[..., 1:])
+    prefix = np.broadcast_to(prefix, shape[:-1] + (horizon + 1,))
+    ends = np.arange(horizon) + window_sizes[..., np.newaxis]
+    valid = ends <= horizon
+    ends = np.broadcast_to(np.minimum(ends, horizon), shape)
+    sums = np.take_along_axis(prefix, ends, axis=-1) - prefix[..., :horizon]
+    return np.where(valid, sums, np.inf)
+
+def hourly_rates(tariffs, first_hour, horizon):
+    """Maps tariffs shaped (..., 24) onto `horizon` hours starting at hour of day `first_hour`."""
+    hours = (first_hour + np.arange(horizon)) % 24
+    return np.asarray(tariffs, dtype=np.float64)[..., hours]
+
+def find_best_windows(forecasts, cycle_lengths, energy_kwh, rates):
+    """
+    Scores every start hour for every appliance under every tariff.
+
+    forecasts:     (appliances, horizon) forecast demand: the profile each
+                   run's energy follows (see window_costs), and the tie-break
+                   between equally priced windows
+    cycle_lengths: (appliances,) run time in hours
+    energy_kwh:    (appliances,) energy per run
+    rates:         (tariffs, horizon) rate per kWh for each forecast hour
+
+    Returns a dict of (tariffs, appliances) arrays: 'start' (index of the best
+    window), 'cost' (cost of running there), 'baseline_cost' (cost of starting
+    at the first forecast hour) and 'savings' (baseline_cost - cost).
+    """
+    forecasts = np.atleast_2d(np.asarray(forecasts, dtype=np.float64))
+    cycle_lengths = np.asarray(cycle_lengths)
+    rates = np.atleast_2d(rates)
+
+    # cost[t, a, s]: appliance a's energy over its window from s, priced by tariff t
+    cost = window_costs(energy_kwh, cycle_lengths, rates[:, np.newaxis, :], forecasts)
+    load = window_sums(forecasts, cycle_lengths)
+    start = np.argmin(tie_break(cost, load), axis=-1)
+
+    best_cost = np.take_along_axis(cost, start[..., np.newaxis], axis=-1)[..., 0]
+    baseline_cost = cost[..., 0]
+    return {
+        'start': start,
+        'cost': best_cost,
+        'baseline_cost': baseline_cost,
+        'savings': np.maximum(0, baseline_cost - best_cost),
+    }
+
+def window_costs(energy_kwh, cycle_lengths, rates, profile=None):
+    """
+    Cost of running each appliance from every start hour. A run's energy is
+    spread over its window in proportion to `profile` (appliances, horizon),
+    the forecast demand, so hours the appliance is expected to draw more in
+    weigh more; where the profile is missing or zero over a window it is
+    spread evenly. Rates may carry leading tariff axes. Windows past the
+    horizon are +inf, also for 0 kWh appliances (0 * inf would be NaN).
+    """
+    cycle_lengths = np.asarray(cycle_lengths)
+    # Average rate per kWh over each window, with energy spread evenly...
+    rate_windows = window_sums(rates, cycle_lengths)
+    fits = np.isfinite(rate_windows)
+    per_kwh = np.where(fits, rate_windows, 0.0) / np.maximum(cycle_lengths, 1)[:, np.newaxis]
+    if profile is not None:
+        # ...or weighted by the forecast profile
+        profile = np.clip(np.asarray(profile, dtype=np.float64), 0.0, None)
+        weight = np.where(fits, window_sums(profile, cycle_lengths), 0.0)
+        weighted = np.where(fits, window_sums(profile * np.asarray(rates, dtype=np.float64), cycle_lengths), 0.0)
+        weighted_fits = weight > 0
+        per_kwh = np.where(weighted_fits, weighted / np.where(weighted_fits, weight, 1.0), per_kwh)
+    energy = np.asarray(energy_kwh, dtype=np.float64)[:, np.newaxis]
+    return np.where(fits, energy * per_kwh, np.inf)
+
+def tie_break(cost, load):
+    """
+    The forecast demand `load` of the starts that are (equally) cheapest in
+    `cost`, +inf elsewhere: argmin over the last axis picks the cheapest start
+    with the lowest forecast demand, which is the one suggestions recommend.
+    """
+    cheapest = cost.min(axis=-1, keepdims=True)
+    tied = np.isclose(cost, cheapest) & np.isfinite(cost)
+    # Tied starts without a forecast rank last among the ties, not with the untied
+    return np.where(tied, np.minimum(load, np.finfo(np.float64).max), np.inf)
+
 def find_cheapest_window(forecast, window_size):
     """
     Finds the starting hour of the cheapest continuous window of time in the forecast.
@@ -26,18 +183,184 @@ def find_cheapest_window(forecast, window_size):
     if not forecast or len(forecast) < window_size:
         return 0
 
-    window_sums = []
-    for i in range(len(forecast) - window_size + 1):
-        window = forecast[i : i + window_size]
-        window_sums.append(sum(window))
+    return int(np.argmin(window_sums(forecast, window_size)))
 
-    if not window_sums:
-        return 0
+# --- Household scheduling ---
 
-    best_start_hour_numpy = np.argmin(window_sums)
-    return int(best_start_hour_numpy)
+def schedule_household(appliances, forecasts=None, peak_kw=DEFAULT_PEAK_KW, tariff=DEFAULT_TARIFF, horizon=24, now=None, time_budget_ms=100):
+    """
+    Schedules every appliance together over the next `horizon` hours so their
+    combined load never exceeds `peak_kw`, at the lowest total cost under the
+    tariff. Each appliance runs once for its cycle length; the cap is checked
+    as if it drew its energy evenly over the cycle. `forecasts` maps appliance
+    type to its forecast, which is priced and breaks ties between equally
+    cheap starts as in find_best_windows, so an appliance that does not
+    compete for the cap starts when its suggestion says. Hours past the end of
+    a forecast are priced at its average demand and lose ties.
+
+    A greedy pass (largest appliances first, each at its cheapest start that
+    still fits) gives a first schedule. Branch and bound over start hours then
+    improves on it, pruning with the sum of every remaining appliance's
+    cheapest start. The search stops after `time_budget_ms`, keeping the best
+    complete schedule found; if none fits every appliance the greedy one is
+    returned and the appliances it could not place are left out.
+
+    Returns a dict with 'status' ('optimal', 'time_limit', or 'partial' when
+    any appliance could not be placed),
+    'total_cost', 'baseline_cost' (every appliance started at once), 'savings',
+    'max_load_kw' and 'schedule': one entry per appliance, or None for
+    appliances that could not be placed.
+    """
+    now = now or datetime.now()
+    count = len(appliances)
+    cycle_lengths = np.array([
+        min(APPLIANCE_CYCLE_LENGTHS.get(a.appliance_type, APPLIANCE_CYCLE_LENGTHS['Default']), horizon)
+        for a in appliances
+    ], dtype=np.int64)
+    energy_kwh = np.array([a.avg_power_consumption_kwh or 0.0 for a in appliances], dtype=np.float64)
+    power_kw = energy_kwh / np.maximum(cycle_lengths, 1)
+    # The first hour is the one after `now`, as for suggestions
+    rates = hourly_rates(TARIFF_PLANS[tariff], now.hour + 1, horizon)
+    # demand[a]: the forecast, continued at its average past its end. Appliances
+    # without one are all zeros, so their energy is spread evenly and they take
+    # their earliest cheapest start.
+    demand = np.zeros((count, horizon))
+    covered = np.full(count, horizon)
+    for a, appliance in enumerate(appliances):
+        forecast = (forecasts or {}).get(appliance.appliance_type)
+        if forecast:
+            covered[a] = min(len(forecast), horizon)
+            demand[a, :covered[a]] = forecast[:covered[a]]
+            demand[a, covered[a]:] = np.mean(forecast[:covered[a]])
+    # cost[a, s]: running appliance a from hour s; +inf where the cycle runs past the horizon
+    cost = window_costs(energy_kwh, cycle_lengths, rates, demand) if count else np.empty((0, horizon))
+    # load[a, s]: forecast demand over that window, to break ties between equal
+    # costs; +inf where the window runs past the forecast
+    load = window_sums(demand, cycle_lengths) if count else np.empty((0, horizon))
+    load[np.arange(horizon) + cycle_lengths[:, np.newaxis] > covered[:, np.newaxis]] = np.inf
+
+    # Appliances drawing more than the cap on their own can never be placed.
+    # The rest are placed largest first, as they are the hardest to fit.
+    placeable = [a for a in range(count) if power_kw[a] <= peak_kw + 1e-9]
+    order = sorted(placeable, key=lambda a: (-power_kw[a] * cycle_lengths[a], a))
+    deadline = time.perf_counter() + time_budget_ms / 1000.0
+
+    starts = _greedy_schedule(order, cost, load, power_kw, cycle_lengths, peak_kw, horizon)
+    if (starts[order] >= 0).all():
+        best_cost = float(cost[order, starts[order]].sum()) if order else 0.0
+    else:
+        best_cost = np.inf
+    improved, finished = _branch_and_bound(order, cost, load, power_kw, cycle_lengths, peak_kw, horizon, best_cost, deadline)
+    if improved is not None:
+        starts = improved
+    if (starts < 0).any():
+        status = 'partial'
+    else:
+        status = 'optimal' if finished else 'time_limit'
+
+    load = np.zeros(horizon)
+    schedule = [None] * count
+    for a in range(count):
+        if starts[a] < 0:
+            continue
+        start, length = int(starts[a]), int(cycle_lengths[a])
+        load[start:start + length] += power_kw[a]
+        schedule[a] = {
+            'start': start,
+            'start_time': now + timedelta(hours=start + 1),
+            'end_time': now + timedelta(hours=start + 1 + length),
+            'cycle_hours': length,
+            'power_kw': float(power_kw[a]),
+            'cost': float(cost[a, start]),
+            'baseline_cost': float(cost[a, 0]),
+            'savings': max(0.0, float(cost[a, 0] - cost[a, start])),
+        }
+    placed = [entry for entry in schedule if entry is not None]
+    total_cost = sum(entry['cost'] for entry in placed)
+    baseline_cost = sum(entry['baseline_cost'] for entry in placed)
+    return {
+        'status': status,
+        'total_cost': total_cost,
+        'baseline_cost': baseline_cost,
+        'savings': max(0.0, baseline_cost - total_cost),
+        'max_load_kw': float(load.max()) if horizon else 0.0,
+        'schedule': schedule,
+    }
+
+def _fitting_starts(load, power_kw, cycle_length, peak_kw):
+    """Mask of the start hours at which `power_kw` for `cycle_length` hours keeps `load` within `peak_kw`."""
+    fits = np.zeros(len(load), dtype=bool)
+    fits[:len(load) - cycle_length + 1] = sliding_window_view(load, cycle_length).max(axis=-1) + power_kw <= peak_kw + 1e-9
+    return fits
+
+def _greedy_schedule(order, cost, demand, power_kw, cycle_lengths, peak_kw, horizon):
+    """
+    Places appliances in `order`, each at its cheapest start that fits (by
+    forecast `demand` among equally cheap ones); -1 where none does.
+    """
+    load = np.zeros(horizon)
+    starts = np.full(len(cost), -1, dtype=np.int64)
+    for a in order:
+        candidates = np.flatnonzero(_fitting_starts(load, power_kw[a], cycle_lengths[a], peak_kw))
+        if not len(candidates):
+            continue
+        start = candidates[np.argmin(tie_break(cost[a, candidates], demand[a, candidates]))]
+        starts[a] = start
+        load[start:start + cycle_lengths[a]] += power_kw[a]
+    return starts
 
-def generate_suggestion(user, appliance, forecast):
+def _branch_and_bound(order, cost, demand, power_kw, cycle_lengths, peak_kw, horizon, best_cost, deadline):
+    """
+    Searches for a complete schedule of the appliances in `order` cheaper than
+    `best_cost`. Returns (starts of the best one found or None, whether the
+    search finished before `deadline`).
+    """
+    if not order:
+        return None, True
+    # bound[k]: the cheapest the appliances from order[k] on can possibly cost
+    cheapest = cost[order].min(axis=1)
+    bound = np.append(np.cumsum(cheapest[::-1])[::-1], 0.0)
+    # Start hours of each appliance from cheapest to dearest (+inf last), equal
+    # costs by forecast demand, so the first schedule found at a cost breaks
+    # ties the way the greedy pass and suggestions do
+    ranked = [np.lexsort((demand[a], np.round(cost[a], 9))) for a in order]
+    load = np.zeros(horizon)
+    starts = np.full(len(cost), -1, dtype=np.int64)
+    best = {'cost': best_cost, 'starts': None}
+    timed_out = False
+
+    def search(k, spent):
+        nonlocal timed_out
+        if k == len(order):
+            best['cost'], best['starts'] = spent, starts.copy()
+            return
+        if time.perf_counter() > deadline:
+            timed_out = True
+            return
+        a = order[k]
+        length = cycle_lengths[a]
+        fits = _fitting_starts(load, power_kw[a], length, peak_kw)
+        for start in ranked[k]:
+            total = spent + cost[a, start]
+            # Starts are in cost order, so once one cannot win neither can the rest
+            if not total + bound[k + 1] < best['cost'] - 1e-9:
+                break
+            if not fits[start]:
+                continue
+            load[start:start + length] += power_kw[a]
+            starts[a] = start
+            search(k + 1, total)
+            load[start:start + length] -= power_kw[a]
+            starts[a] = -1
+            if timed_out:
+                return
+
+    search(0, 0.0)
+    return best['starts'], not timed_out
+
+# --- Suggestions ---
+
+def generate_suggestion(user, appliance, forecast, tariff=DEFAULT_TARIFF, now=None):
     """
     Analyzes an appliance-specific forecast and returns a dictionary
     containing the suggestion text and the potential savings.
@@ -46,18 +369,61 @@ def generate_suggestion(user, appliance, forecast):
         # Return a dictionary even in case of an error
         return {'text': "Could not generate a suggestion due to a forecast error.", 'savings': 0.0}
 
-    appliance_type = appliance.appliance_type
-    cycle_length = APPLIANCE_CYCLE_LENGTHS.get(appliance_type, APPLIANCE_CYCLE_LENGTHS['Default'])
+    return generate_suggestions(user, [appliance], {appliance.appliance_type: forecast}, tariff, now)[0]
 
-    best_hour_from_now = find_cheapest_window(forecast, cycle_length) + 1
+def generate_suggestions(user, appliances, forecasts, tariff=DEFAULT_TARIFF, now=None):
+    """
+    Generates suggestions for several appliances at once. `forecasts` maps
+    appliance type to its forecast, so appliances of the same type share one.
+    All appliances with a forecast are scored against the tariff in one batch.
+    Returns one result per appliance, or None where no forecast is available.
+    """
+    now = now or datetime.now()
+    scores = score_appliances(appliances, forecasts, tariff, now)
+    return [
+        None if score is None else format_suggestion(user, appliance, score, now)
+        for appliance, score in zip(appliances, scores)
+    ]
 
-    suggestion_time = datetime.now() + timedelta(hours=best_hour_from_now)
-    formatted_time = suggestion_time.strftime("%I:%M %p")
+def score_appliances(appliances, forecasts, tariff=DEFAULT_TARIFF, now=None):
+    """
+    Finds the best start for each appliance, scored in one batch per forecast
+    length. A score depends only on the appliance, its forecast, the tariff and
+    `now`, not on the user, so it can be shared by every owner of the
+    appliance. Returns (cycle_length, best_hour_from_now, savings, horizon) per
+    appliance, or None where no forecast is available.
+    """
+    now = now or datetime.now()
+    scores = [None] * len(appliances)
+    scored = [i for i, a in enumerate(appliances) if forecasts.get(a.appliance_type)]
+    # Forecasts of different lengths can't share one 2-D array; score each length separately
+    by_horizon = {}
+    for i in scored:
+        by_horizon.setdefault(len(forecasts[appliances[i].appliance_type]), []).append(i)
 
-    consumption_kwh = appliance.avg_power_consumption_kwh or 0.0
-    cost_at_peak = consumption_kwh * PEAK_RATE_PER_KWH
-    cost_at_off_peak = consumption_kwh * OFF_PEAK_RATE_PER_KWH
-    savings = max(0, cost_at_peak - cost_at_off_peak)
+    for horizon, indices in by_horizon.items():
+        group = [appliances[i] for i in indices]
+        cycle_lengths = np.array([
+            min(APPLIANCE_CYCLE_LENGTHS.get(a.appliance_type, APPLIANCE_CYCLE_LENGTHS['Default']), horizon)
+            for a in group
+        ])
+        # The first forecast value is for the hour after `now`
+        rates = hourly_rates(TARIFF_PLANS[tariff], now.hour + 1, horizon)
+        best = find_best_windows(
+            [forecasts[a.appliance_type] for a in group],
+            cycle_lengths,
+            [a.avg_power_consumption_kwh or 0.0 for a in group],
+            rates,
+        )
+        for j, i in enumerate(indices):
+            scores[i] = (int(cycle_lengths[j]), int(best['start'][0, j]) + 1, float(best['savings'][0, j]), horizon)
+    return scores
+
+def format_suggestion(user, appliance, score, now):
+    """Builds the suggestion text and savings for a score from score_appliances."""
+    cycle_length, best_hour_from_now, savings, horizon = score
+    suggestion_time = now + timedelta(hours=best_hour_from_now)
+    formatted_time = suggestion_time.strftime("%I:%M %p")
     formatted_savings = f"{savings:.2f}"
 
     if cycle_length > 1:
@@ -69,14 +435,12 @@ def generate_suggestion(user, appliance, forecast):
     else:
         suggestion_text = (
             f"Hi {user.username}, for your {appliance.brand} {appliance.model}, "
-            f"the cheapest time to use it in the next 24 hours is around {formatted_time}. "
+            f"the cheapest time to use it in the next {horizon} hours is around {formatted_time}. "
             f"This can save you ~₹{formatted_savings} and helps balance the grid."
         )
 
-    # --- THIS IS THE KEY CHANGE ---
     # Return a dictionary with both the text and the raw savings number.
     return {
         'text': suggestion_text,
         'savings': round(savings, 2)
     }
-
@@ -1,82 +1,329 @@
 # app.py
-from flask import Flask, jsonify, request, session
+from flask import Flask, Response, abort, jsonify, request, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import os
-import pandas as pd
-from tensorflow.keras.models import load_model
-import pickle
-from sklearn.preprocessing import MinMaxScaler
-from advisor_logic import generate_suggestion
+from advisor_logic import generate_suggestion, generate_suggestions, schedule_household, TARIFF_PLANS, DEFAULT_TARIFF, DEFAULT_PEAK_KW
+from versioned_cache import VersionedCache
+from timeseries_store import TimeSeriesStore
+from model_registry import DIRECT, ModelRegistry
+from inference_service import InferenceService, InferenceTimeout
+from savings_ledger import SavingsLedgerWriter
+from numpy_inference import predict_many, rollout_many
+from instrumentation import Instrumentation
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import hashlib
+import hmac
+import io
+import logging
 import numpy as np
-from datetime import date, timedelta # Import date and timedelta
+from datetime import date, datetime, timedelta # Import date and timedelta
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 # App initialization and ML model loading...
 basedir = os.path.abspath(os.path.dirname(__file__))
 app = Flask(__name__)
-CORS(app, supports_credentials=True, origins=["http://localhost:3000"]) 
+CORS(app, supports_credentials=True, origins=["http://localhost:3000"], expose_headers=["X-Next-Cursor"])
 app.config['SECRET_KEY'] = 'a-very-secret-and-hard-to-guess-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'instance', 'ecowise.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('ECOWISE_DATABASE_URI', 'sqlite:///' + os.path.join(basedir, 'instance', 'ecowise.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# An in-memory SQLite database (e.g. in tests) gets a StaticPool, which takes no sizing options
+database_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+if not (database_url.get_backend_name() == 'sqlite' and database_url.database in (None, '', ':memory:')):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('ECOWISE_DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('ECOWISE_DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('ECOWISE_DB_POOL_TIMEOUT', 10.0)), # seconds
+    }
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('ECOWISE_SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['FORECAST_CACHE_TTL'] = int(os.environ.get('ECOWISE_FORECAST_CACHE_TTL', 900)) # seconds
+app.config['FORECAST_CACHE_SIZE'] = int(os.environ.get('ECOWISE_FORECAST_CACHE_SIZE', 128))
+# Optional directory holding a memory-mapped snapshot of the consumption data (see TimeSeriesStore.save)
+app.config['TIMESERIES_MMAP_DIR'] = os.environ.get('ECOWISE_TIMESERIES_MMAP_DIR')
+# 'keras' runs the saved models with TensorFlow; 'numpy' evaluates the same weights
+# with NumPy (see numpy_inference.py) and never imports TensorFlow.
+app.config['INFERENCE_BACKEND'] = os.environ.get('ECOWISE_INFERENCE_BACKEND', 'keras')
+app.config['MODEL_REGISTRY_MAX_RESIDENT'] = int(os.environ.get('ECOWISE_MODEL_REGISTRY_MAX_RESIDENT', 32))
+app.config['MODEL_REGISTRY_CHECK_INTERVAL'] = float(os.environ.get('ECOWISE_MODEL_REGISTRY_CHECK_INTERVAL', 5.0)) # seconds
+# Forecast cache misses are queued to a worker thread that batches them (see inference_service.py)
+app.config['INFERENCE_SERVICE_ENABLED'] = os.environ.get('ECOWISE_INFERENCE_SERVICE_ENABLED', '1') == '1'
+app.config['INFERENCE_BATCH_WINDOW_MS'] = float(os.environ.get('ECOWISE_INFERENCE_BATCH_WINDOW_MS', 2.0))
+app.config['INFERENCE_MAX_BATCH'] = int(os.environ.get('ECOWISE_INFERENCE_MAX_BATCH', 64))
+app.config['INFERENCE_TIMEOUT'] = float(os.environ.get('ECOWISE_INFERENCE_TIMEOUT', 30.0)) # seconds
+# Forecasts stored by precompute_forecasts.py are used until they are this old
+app.config['FORECAST_MAX_AGE'] = int(os.environ.get('ECOWISE_FORECAST_MAX_AGE', 3600)) # seconds
+# Largest page /appliances returns when a client asks for one with ?limit=
+app.config['APPLIANCE_PAGE_MAX'] = int(os.environ.get('ECOWISE_APPLIANCE_PAGE_MAX', 500))
+app.config['CATALOG_CACHE_SIZE'] = int(os.environ.get('ECOWISE_CATALOG_CACHE_SIZE', 256))
+# Accepted suggestions are written by one thread that commits them in batches (see savings_ledger.py)
+app.config['SAVINGS_WRITER_ENABLED'] = os.environ.get('ECOWISE_SAVINGS_WRITER_ENABLED', '1') == '1'
+app.config['SAVINGS_BATCH_WINDOW_MS'] = float(os.environ.get('ECOWISE_SAVINGS_BATCH_WINDOW_MS', 5.0))
+app.config['SAVINGS_MAX_BATCH'] = int(os.environ.get('ECOWISE_SAVINGS_MAX_BATCH', 256))
+app.config['SAVINGS_WRITE_TIMEOUT'] = float(os.environ.get('ECOWISE_SAVINGS_WRITE_TIMEOUT', 10.0)) # seconds
+# Adds a Server-Timing header with each request's stage breakdown (see instrumentation.py)
+app.config['TIMING_HEADER'] = os.environ.get('ECOWISE_TIMING_HEADER', '0') == '1'
+# Requests slower than this have their sampled stacks logged; 0 disables the profiler
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('ECOWISE_SLOW_REQUEST_MS', 0))
+# Meters authenticate to POST /readings with this token in an X-Ingest-Token header
+app.config['INGEST_TOKEN'] = os.environ.get('ECOWISE_INGEST_TOKEN')
+app.config['INGEST_BATCH_SIZE'] = int(os.environ.get('ECOWISE_INGEST_BATCH_SIZE', 5000))
+# The dataset's Datetime column is naive local time in this zone; ingested readings with a UTC offset are converted to it
+app.config['DATASET_TIMEZONE'] = os.environ.get('ECOWISE_DATASET_TIMEZONE', 'UTC')
+# Household schedules (GET /user/<id>/schedule) keep total load under this cap unless ?peak_kw= is given
+app.config['HOUSEHOLD_PEAK_KW'] = float(os.environ.get('ECOWISE_HOUSEHOLD_PEAK_KW', DEFAULT_PEAK_KW))
+app.config['SCHEDULE_MAX_HOURS'] = int(os.environ.get('ECOWISE_SCHEDULE_MAX_HOURS', 168))
+app.config['SCHEDULE_TIME_BUDGET_MS'] = float(os.environ.get('ECOWISE_SCHEDULE_TIME_BUDGET_MS', 100.0))
 db = SQLAlchemy(app)
+logger = logging.getLogger(__name__)
 
-from models import Appliance, User
+from models import Appliance, Forecast, User
+import repository
 
-print("--- Loading all available ML models and scalers ---")
-models = {}
-scalers = {}
+instrumentation = Instrumentation(timing_header=app.config['TIMING_HEADER'], slow_request_ms=app.config['SLOW_REQUEST_MS'])
+
+with app.app_context():
+    repository.configure_sqlite(db.engine, app.config['SQLITE_BUSY_TIMEOUT_MS'])
+    instrumentation.init_app(app, db.engine)
+
+# Models, scalers and the consumption data are loaded on first use, so importing
+# the app (e.g. from create_db.py) does not pay for TensorFlow or pandas.
+use_numpy_backend = app.config['INFERENCE_BACKEND'] == 'numpy'
 model_dir = os.path.join(basedir, 'ml', 'saved_model')
-if os.path.exists(model_dir):
-    for filename in os.listdir(model_dir):
-        try:
-            if filename.endswith("_model.h5"):
-                appliance_key = filename.replace("_model.h5", "")
-                models[appliance_key] = load_model(os.path.join(model_dir, filename))
-            elif filename.endswith("_scaler.pkl"):
-                appliance_key = filename.replace("_scaler.pkl", "")
-                with open(os.path.join(model_dir, filename), 'rb') as f:
-                    scalers[appliance_key] = pickle.load(f)
-        except Exception as e:
-            print(f"Error loading file {filename}: {e}")
+model_registry = ModelRegistry(
+    model_dir,
+    backend=app.config['INFERENCE_BACKEND'],
+    max_resident=app.config['MODEL_REGISTRY_MAX_RESIDENT'],
+    check_interval=app.config['MODEL_REGISTRY_CHECK_INTERVAL'],
+)
+
+DATASET_PATH = os.environ.get('ECOWISE_DATASET_PATH', os.path.join(basedir, 'data', 'power_consumption.csv'))
+timeseries_store = TimeSeriesStore(DATASET_PATH, mmap_dir=app.config['TIMESERIES_MMAP_DIR'])
+
+# Forecasts only change when the dataset or an appliance's model files change,
+# so they are shared across users and cached per appliance type.
+forecast_cache = VersionedCache(ttl=app.config['FORECAST_CACHE_TTL'], max_entries=app.config['FORECAST_CACHE_SIZE'])
+# Serialized /appliances responses, keyed by (query, catalog version). Entries
+# for an older catalog version are dropped as soon as a newer one is stored.
+catalog_cache = VersionedCache(ttl=24 * 3600, max_entries=app.config['CATALOG_CACHE_SIZE'])
+
+def get_forecast_version(appliance_type, appliance_key):
+    """Identifies the readings and model files a forecast for this appliance depends on."""
+    return (timeseries_store.version(appliance_type), model_registry.signature(appliance_key))
 
 def get_appliance_forecast(appliance_type):
     appliance_key = appliance_type.lower().replace(' ', '_')
-    model = models.get(appliance_key)
-    scaler = scalers.get(appliance_key)
-    if not model or not scaler:
-        print(f"Error: Model or scaler not found for key '{appliance_key}'.")
+    with instrumentation.stage('data_refresh'):
+        timeseries_store.refresh()
+    version = get_forecast_version(appliance_type, appliance_key)
+    return forecast_cache.get_or_compute(appliance_type, version, lambda: run_forecasts([appliance_type]).get(appliance_type))
+
+def get_appliance_forecasts(appliance_types):
+    """Returns {appliance_type: forecast or None}, computing all cache misses in one batch."""
+    with instrumentation.stage('data_refresh'):
+        timeseries_store.refresh()
+    versions = {t: get_forecast_version(t, t.lower().replace(' ', '_')) for t in set(appliance_types)}
+    return forecast_cache.get_or_compute_many(versions, run_forecasts)
+
+def run_forecasts(appliance_types):
+    """
+    Produces forecasts for cache misses: fresh precomputed forecasts from the
+    database first, then live inference for the rest.
+    """
+    forecasts = load_stored_forecasts(appliance_types)
+    missing = [t for t in appliance_types if forecasts.get(t) is None]
+    if missing:
+        forecasts.update(infer_forecasts(missing))
+    return forecasts
+
+def infer_forecasts(appliance_types):
+    """Runs the models through the batching inference service, or inline when it is disabled."""
+    with instrumentation.stage('inference'):
+        if inference_service is None:
+            return compute_appliance_forecasts(appliance_types)
+        try:
+            return inference_service.forecast_many(appliance_types, timeout=app.config['INFERENCE_TIMEOUT'])
+        except InferenceTimeout as e:
+            # Left uncached (None), so the next request tries again
+            logger.warning("Inference timed out for %s", e.pending)
+            instrumentation.error('inference', 'timeout')
+            return {**e.results, **dict.fromkeys(e.pending)}
+
+def get_model_version(appliance_type):
+    """
+    A process-independent tag for the model files and readings a forecast is
+    computed from; stored forecasts with a different tag are stale.
+    """
+    model_version = model_registry.version_tag(appliance_type.lower().replace(' ', '_'))
+    if model_version is None:
         return None
+    times = timeseries_store.times(appliance_type)
+    last_reading = str(times[-1]) if len(times) else 'none'
+    return f"{model_version}/{len(times)}@{last_reading}"
+
+def load_stored_forecasts(appliance_types):
+    """Returns {appliance_type: values} for types with a fresh precomputed forecast."""
+    if not appliance_types:
+        return {}
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['FORECAST_MAX_AGE'])
     try:
-        DATASET_PATH = os.path.join(basedir, 'data', 'power_consumption.csv') # Assuming this is the correct file name now
-        df = pd.read_csv(DATASET_PATH)
-        appliance_df = df[df['Appliance'] == appliance_type]
-        if len(appliance_df) < 24: return None
-        power_data = appliance_df[['PowerConsumption']].values.astype('float32')
-        last_24_hours = power_data[-24:]
-        last_24_hours_scaled = scaler.transform(last_24_hours)
-        predictions_scaled = []
-        current_batch = last_24_hours_scaled.reshape((1, 24, 1))
-        for _ in range(24):
-            current_pred = model.predict(current_batch, verbose=0)[0]
-            predictions_scaled.append(current_pred)
-            current_batch = np.append(current_batch[:,1:,:], [[current_pred]], axis=1)
-        predictions = scaler.inverse_transform(predictions_scaled)
-        return [float(p) for p in predictions]
-    except Exception as e:
-        print(f"An error occurred during prediction for {appliance_type}: {e}")
-        return None
+        with instrumentation.stage('stored_forecasts'):
+            latest = db.session.query(Forecast.appliance_type, func.max(Forecast.generated_at).label('generated_at')) \
+                .filter(Forecast.appliance_type.in_(appliance_types), Forecast.generated_at >= cutoff) \
+                .group_by(Forecast.appliance_type).subquery()
+            rows = db.session.query(Forecast).join(latest, (Forecast.appliance_type == latest.c.appliance_type) & (Forecast.generated_at == latest.c.generated_at)).all()
+    except SQLAlchemyError as e:
+        # e.g. a database created before the forecast table existed
+        db.session.rollback()
+        logger.warning("Could not read stored forecasts: %s", e)
+        instrumentation.error('stored_forecasts', 'query_failed')
+        return {}
+    return {
+        row.appliance_type: [float(v) for v in row.values]
+        for row in rows
+        if row.model_version == get_model_version(row.appliance_type)
+    }
+
+def compute_appliance_forecast(appliance_type):
+    return compute_appliance_forecasts([appliance_type]).get(appliance_type)
+
+def compute_appliance_forecasts(appliance_types):
+    """
+    Forecasts the next 24 hours for each appliance type. Direct models (see
+    the model's metadata) predict all 24 hours in one forward pass; recursive
+    ones are rolled out one hour at a time. With the NumPy backend every type's
+    input window is stacked into one (k, 24, 1) batch per kind and evaluated
+    together; Keras models are separate graphs, so they run one by one.
+    """
+    forecasts = {}
+    batch = [] # (appliance_type, model, scaler, kind, scaled window)
+    for appliance_type in appliance_types:
+        appliance_key = appliance_type.lower().replace(' ', '_')
+        model, scaler, metadata = model_registry.get_with_metadata(appliance_key)
+        forecasts[appliance_type] = None
+        if not model or not scaler:
+            logger.error("Model or scaler not found for key '%s'.", appliance_key)
+            instrumentation.error('forecast', 'model_missing')
+            continue
+        if metadata['kind'] == DIRECT and metadata['horizon'] < 24:
+            logger.error("Direct model for '%s' only forecasts %s hours.", appliance_key, metadata['horizon'])
+            instrumentation.error('forecast', 'model_invalid')
+            continue
+        last_24_hours = timeseries_store.last(appliance_type, 24).reshape(-1, 1)
+        if len(last_24_hours) < 24:
+            instrumentation.error('forecast', 'not_enough_data')
+            continue
+        with instrumentation.stage('scaling'):
+            batch.append((appliance_type, model, scaler, metadata['kind'], scaler.transform(last_24_hours)))
+    if not batch:
+        return forecasts
+    try:
+        predictions_scaled = {}
+        with instrumentation.stage('predict'):
+            for kind in {kind for _, _, _, kind, _ in batch}:
+                group = [item for item in batch if item[3] == kind]
+                if use_numpy_backend:
+                    windows = np.stack([window for _, _, _, _, window in group])
+                    models = [model for _, model, _, _, _ in group]
+                    scaled = predict_many(models, windows)[:, :24] if kind == DIRECT else rollout_many(models, windows, 24)
+                elif kind == DIRECT:
+                    scaled = [model.predict(window.reshape((1, 24, 1)), verbose=0)[0, :24] for _, model, _, _, window in group]
+                else:
+                    scaled = [_keras_rollout(model, window, 24) for _, model, _, _, window in group]
+                predictions_scaled.update(zip((t for t, _, _, _, _ in group), scaled))
+        with instrumentation.stage('scaling'):
+            for appliance_type, _, scaler, _, _ in batch:
+                predictions = scaler.inverse_transform(np.reshape(predictions_scaled[appliance_type], (-1, 1)))
+                forecasts[appliance_type] = [float(p) for p in predictions.ravel()]
+    except Exception:
+        logger.exception("Prediction failed for %s", [t for t, _, _, _, _ in batch])
+        instrumentation.error('forecast', 'prediction_failed')
+    return forecasts
+
+def _keras_rollout(model, last_24_hours_scaled, steps):
+    predictions_scaled = []
+    current_batch = last_24_hours_scaled.reshape((1, 24, 1))
+    for _ in range(steps):
+        current_pred = model.predict(current_batch, verbose=0)[0]
+        predictions_scaled.append(current_pred)
+        current_batch = np.append(current_batch[:,1:,:], [[current_pred]], axis=1)
+    return np.array(predictions_scaled)
+
+inference_service = InferenceService(
+    compute_appliance_forecasts,
+    batch_window_ms=app.config['INFERENCE_BATCH_WINDOW_MS'],
+    max_batch=app.config['INFERENCE_MAX_BATCH'],
+    instrumentation=instrumentation,
+) if app.config['INFERENCE_SERVICE_ENABLED'] else None
+
+def write_accepts(accepts):
+    # Runs on the ledger writer thread, outside any request
+    with app.app_context():
+        return repository.record_accepts(accepts)
+
+savings_writer = SavingsLedgerWriter(
+    write_accepts,
+    batch_window_ms=app.config['SAVINGS_BATCH_WINDOW_MS'],
+    max_batch=app.config['SAVINGS_MAX_BATCH'],
+) if app.config['SAVINGS_WRITER_ENABLED'] else None
+
+def collect_component_stats():
+    """Metric families read from the caches, model registry and worker threads at scrape time."""
+    families = []
+    for name, cache in (('forecast', forecast_cache), ('catalog', catalog_cache)):
+        stats = cache.stats()
+        families += [
+            (f'ecowise_{name}_cache_hits_total', 'counter', f'{name.title()} cache hits.', [({}, stats['hits'])]),
+            (f'ecowise_{name}_cache_misses_total', 'counter', f'{name.title()} cache misses.', [({}, stats['misses'])]),
+            (f'ecowise_{name}_cache_evictions_total', 'counter', f'{name.title()} cache evictions.', [({}, stats['evictions'])]),
+            (f'ecowise_{name}_cache_entries', 'gauge', f'{name.title()} cache entries held.', [({}, stats['entries'])]),
+        ]
+    registry = model_registry.stats()
+    families += [
+        ('ecowise_model_loads_total', 'counter', 'Model and scaler pairs loaded, including reloads.', [({}, registry['loads'])]),
+        ('ecowise_model_reloads_total', 'counter', 'Models reloaded after their files changed.', [({}, registry['reloads'])]),
+        ('ecowise_model_evictions_total', 'counter', 'Models evicted from memory.', [({}, registry['evictions'])]),
+        ('ecowise_models_resident', 'gauge', 'Models held in memory.', [({}, registry['resident'])]),
+        ('ecowise_model_load_seconds', 'gauge', 'Duration of the latest load of each model.',
+         [({'model': key}, seconds) for key, seconds in sorted(registry['load_seconds'].items())]),
+    ]
+    if inference_service is not None:
+        stats = inference_service.stats()
+        families += [
+            ('ecowise_inference_requests_total', 'counter', 'Forecasts requested from the inference worker.', [({}, stats['requests'])]),
+            ('ecowise_inference_batches_total', 'counter', 'Batches run by the inference worker.', [({}, stats['batches'])]),
+            ('ecowise_inference_queued', 'gauge', 'Forecast requests waiting for the inference worker.', [({}, stats['queued'])]),
+        ]
+    if savings_writer is not None:
+        stats = savings_writer.stats()
+        families += [
+            ('ecowise_savings_accepts_total', 'counter', 'Accepts written by the savings ledger writer.', [({}, stats['accepts'])]),
+            ('ecowise_savings_batches_total', 'counter', 'Transactions committed by the savings ledger writer.', [({}, stats['batches'])]),
+            ('ecowise_savings_failed_batches_total', 'counter', 'Savings ledger batches that failed.', [({}, stats['failed_batches'])]),
+        ]
+    return families
+
+instrumentation.registry.add_collector(collect_component_stats)
 
 # --- API Endpoints ---
 # (Authentication and other management endpoints are unchanged)
 @app.route('/')
 def index(): return "Welcome!"
+# Prometheus scrape endpoint; each server process reports its own metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(instrumentation.registry.render(), mimetype='text/plain; version=0.0.4')
 @app.route('/register', methods=['POST'])
 def register():
     data = request.get_json(); u, p, l = data.get('username'), data.get('password'), data.get('location', 'N/A')
     if not u or not p: return jsonify({'error': 'Username and password are required'}), 400
-    if User.query.filter_by(username=u).first(): return jsonify({'error': 'Username already exists'}), 400
     new_user = User(username=u, location=l); new_user.set_password(p)
-    db.session.add(new_user); db.session.commit()
+    db.session.add(new_user)
+    # The unique constraint on username catches duplicates without a lookup first
+    try: db.session.commit()
+    except IntegrityError:
+        db.session.rollback(); return jsonify({'error': 'Username already exists'}), 400
     return jsonify({'message': 'User registered', 'user_id': new_user.id}), 201
 @app.route('/login', methods=['POST'])
 def login():
@@ -94,34 +341,117 @@ def get_current_user():
     user = User.query.get(user_id)
     if not user: return jsonify({'error': 'User not found'}), 404
     return jsonify({'id': user.id, 'username': user.username, 'location': user.location})
+def parse_flag(value):
+    """Parses an optional boolean query parameter; raises ValueError for anything unrecognised."""
+    if value is None: return None
+    if value.lower() in ('1', 'true', 'yes'): return True
+    if value.lower() in ('0', 'false', 'no'): return False
+    raise ValueError(value)
+def parse_int(value):
+    """Parses an optional integer query parameter; raises ValueError for anything else."""
+    if value is None: return None
+    if not value.isascii() or not value.isdigit(): raise ValueError(value)
+    return int(value)
+
+# Returns the catalog as a JSON array, optionally filtered by ?type=, ?brand=,
+# ?eco_mode= and ?delay_start=. With ?limit= it returns one page, and the
+# X-Next-Cursor header holds the ?cursor= value for the next one.
 @app.route('/appliances', methods=['GET'])
 def get_appliances():
-    appliances = Appliance.query.all()
-    return jsonify([{'id': a.id, 'brand': a.brand, 'model': a.model, 'type': a.appliance_type} for a in appliances])
+    try:
+        filters = {
+            'appliance_type': request.args.get('type'),
+            'brand': request.args.get('brand'),
+            'eco_mode': parse_flag(request.args.get('eco_mode')),
+            'delay_start': parse_flag(request.args.get('delay_start')),
+        }
+    except ValueError:
+        return jsonify({'error': 'Invalid filter value'}), 400
+    try:
+        cursor = parse_int(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    try:
+        limit = parse_int(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': 'limit must be a whole number'}), 400
+    if limit is not None and not 1 <= limit <= app.config['APPLIANCE_PAGE_MAX']:
+        return jsonify({'error': f"limit must be between 1 and {app.config['APPLIANCE_PAGE_MAX']}"}), 400
+
+    version, updated_at = repository.get_catalog_state()
+
+    def render():
+        rows = repository.list_appliances(**filters, after_id=cursor, limit=limit + 1 if limit else None)
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1].id)
+        body = app.json.dumps([{'id': a.id, 'brand': a.brand, 'model': a.model, 'type': a.appliance_type} for a in rows])
+        return body.encode(), hashlib.sha1(body.encode()).hexdigest(), next_cursor
+
+    query_key = ('appliances', tuple(sorted(filters.items())), cursor, limit)
+    body, etag, next_cursor = catalog_cache.get_or_compute(query_key, (version, updated_at), render)
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    if updated_at is not None:
+        response.last_modified = updated_at
+    # Browsers keep the response but revalidate it; unchanged catalogs get a 304
+    response.cache_control.no_cache = True
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response.make_conditional(request)
 @app.route('/user/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     if session.get('user_id') != user_id: return jsonify({'error': 'Forbidden'}), 403
     user = User.query.get_or_404(user_id)
-    return jsonify({'id': user.id, 'username': user.username, 'appliances': [{'id': a.id, 'brand': a.brand, 'model': a.model} for a in user.appliances]})
+    appliances = repository.get_user_appliance_summaries(user_id)
+    return jsonify({'id': user.id, 'username': user.username, 'appliances': [{'id': a.id, 'brand': a.brand, 'model': a.model} for a in appliances]})
 @app.route('/user/<int:user_id>/appliance', methods=['POST'])
 def add_user_appliance(user_id):
     if session.get('user_id') != user_id: return jsonify({'error': 'Forbidden'}), 403
-    user = User.query.get_or_404(user_id); data = request.get_json(); appliance_id = data.get('appliance_id')
+    User.query.get_or_404(user_id); data = request.get_json(); appliance_id = data.get('appliance_id')
     if not appliance_id: return jsonify({'error': 'Missing appliance_id'}), 400
-    appliance = Appliance.query.get_or_404(appliance_id)
-    if appliance in user.appliances: return jsonify({'message': 'Already in profile'}), 200
-    user.appliances.append(appliance); db.session.commit()
+    Appliance.query.get_or_404(appliance_id)
+    if not repository.add_user_appliance(user_id, appliance_id): return jsonify({'message': 'Already in profile'}), 200
     return jsonify({'message': 'Appliance added'}), 201
 @app.route('/user/<int:user_id>/appliance/<int:appliance_id>', methods=['DELETE', 'OPTIONS'])
 def remove_user_appliance(user_id, appliance_id):
     if request.method == 'OPTIONS': return jsonify({'status': 'ok'}), 200
     if session.get('user_id') != user_id: return jsonify({'error': 'Forbidden'}), 403
-    user = User.query.get_or_404(user_id); appliance = Appliance.query.get_or_404(appliance_id)
-    if appliance in user.appliances:
-        user.appliances.remove(appliance); db.session.commit()
+    User.query.get_or_404(user_id); Appliance.query.get_or_404(appliance_id)
+    if repository.remove_user_appliance(user_id, appliance_id):
         return jsonify({'message': 'Appliance removed'}), 200
     return jsonify({'error': 'Appliance not found'}), 404
 
+# Ingests meter readings streamed as CSV (text/csv), a JSON array
+# (application/json) or newline-delimited JSON (application/x-ndjson).
+@app.route('/readings', methods=['POST'])
+def post_readings():
+    # Meter feeds authenticate with the shared ingest token; a user session
+    # is not enough, and without a configured token ingestion is disabled.
+    token = app.config['INGEST_TOKEN']
+    sent_token = request.headers.get('X-Ingest-Token', '')
+    if not (token and hmac.compare_digest(sent_token.encode(), token.encode())):
+        return jsonify({'error': 'Not authorized'}), 401
+    from ingest_readings import ingest, iter_csv_records, iter_json_records
+    body = io.BufferedReader(request.stream)
+    if request.mimetype == 'text/csv':
+        records = iter_csv_records(io.TextIOWrapper(body, encoding='utf-8', newline=''))
+    elif request.mimetype in ('application/json', 'application/x-ndjson'):
+        records = iter_json_records(body)
+    else:
+        return jsonify({'error': 'Send text/csv, application/json or application/x-ndjson'}), 415
+    with instrumentation.stage('ingest'):
+        result = ingest(records, batch_size=app.config['INGEST_BATCH_SIZE'])
+    if result.not_recorded:
+        status = 503  # safe to retry: the dataset skips what it has and the table is filled in
+    elif result.rejected and not (result.inserted or result.duplicates):
+        status = 400
+    else:
+        status = 200
+    return jsonify(result.to_dict()), status
+
 # --- NEW DASHBOARD ENDPOINTS ---
 
 @app.route('/user/<int:user_id>/stats', methods=['GET'])
@@ -132,13 +462,10 @@ def get_user_stats(user_id):
     user = User.query.get_or_404(user_id)
     
     # Calculate consumption breakdown
-    consumption_breakdown = []
-    if user.appliances:
-        for appliance in user.appliances:
-            consumption_breakdown.append({
-                'type': appliance.appliance_type,
-                'consumption_kwh': appliance.avg_power_consumption_kwh
-            })
+    consumption_breakdown = [
+        {'type': appliance_type, 'consumption_kwh': consumption_kwh}
+        for appliance_type, consumption_kwh in repository.get_consumption_breakdown(user_id)
+    ]
 
     return jsonify({
         'username': user.username,
@@ -153,28 +480,45 @@ def accept_suggestion():
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get_or_404(user_id)
     data = request.get_json()
-    savings = data.get('savings', 0.0)
-
-    today = date.today()
-    yesterday = today - timedelta(days=1)
-
-    # Logic to update the streak
-    if user.last_suggestion_date == yesterday:
-        user.current_streak += 1 # Continue the streak
-    elif user.last_suggestion_date != today:
-        user.current_streak = 1 # Start a new streak
-    # If they already accepted today, do nothing to the streak
+    try:
+        savings = float(data.get('savings', 0.0))
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid savings'}), 400
+    if not 0 <= savings < float('inf'):  # also rejects NaN
+        return jsonify({'error': 'savings must be a finite, non-negative number'}), 400
 
-    user.last_suggestion_date = today
-    user.total_savings += savings
-    db.session.commit()
+    # The streak continues from yesterday, restarts after a gap, and is left
+    # alone if they already accepted today; the update is done atomically in
+    # SQL (see repository.record_accepts) together with the ledger entry.
+    accept = (user_id, savings, date.today())
+    if savings_writer is None:
+        result = repository.record_accepts([accept])[0]
+    else:
+        future = savings_writer.submit(accept)
+        try:
+            result = future.result(app.config['SAVINGS_WRITE_TIMEOUT'])
+        except FutureTimeoutError:
+            if not future.cancel():
+                # Its batch is already being written; the transaction is
+                # bounded by the SQLite busy timeout, so wait for the outcome
+                # rather than leave the client unsure whether it counted.
+                result = future.result()
+            else:
+                # Cancelled while still queued, so it will never be written
+                # and a retry counts it exactly once.
+                instrumentation.error('savings', 'write_timeout')
+                response = jsonify({'error': 'Savings ledger is busy, please retry'})
+                response.headers['Retry-After'] = '1'
+                return response, 503
+    if result is None:
+        abort(404)
+    new_streak, new_total_savings = result
 
     return jsonify({
         'message': 'Suggestion accepted!',
-        'new_streak': user.current_streak,
-        'new_total_savings': round(user.total_savings, 2)
+        'new_streak': new_streak,
+        'new_total_savings': round(new_total_savings, 2)
     })
 
 # --- UPDATED SUGGESTION ENDPOINT ---
@@ -183,11 +527,16 @@ def accept_suggestion():
 def get_suggestion(user_id, appliance_id):
     if session.get('user_id') != user_id: return jsonify({'error': 'Forbidden'}), 403
     user = User.query.get_or_404(user_id); appliance = Appliance.query.get_or_404(appliance_id)
-    if appliance not in user.appliances: return jsonify({'error': 'Appliance not found'}), 400
+    if not repository.user_has_appliance(user_id, appliance_id): return jsonify({'error': 'Appliance not found'}), 400
+    tariff = request.args.get('tariff', DEFAULT_TARIFF)
+    if tariff not in TARIFF_PLANS: return jsonify({'error': 'Unknown tariff'}), 400
     forecast = get_appliance_forecast(appliance.appliance_type)
-    if not forecast: return jsonify({'error': 'Could not retrieve forecast'}), 500
+    if not forecast:
+        instrumentation.error('suggestion', 'forecast_unavailable')
+        return jsonify({'error': 'Could not retrieve forecast'}), 500
     
-    result = generate_suggestion(user, appliance, forecast)
+    with instrumentation.stage('suggestion'):
+        result = generate_suggestion(user, appliance, forecast, tariff)
     
     return jsonify({
         'user': user.username, 
@@ -196,8 +545,93 @@ def get_suggestion(user_id, appliance_id):
         'savings': result['savings']
     })
 
-if __name__ == '__main__':
+# Returns suggestions for every appliance in the user's profile in one response,
+# forecasting each appliance type once.
+@app.route('/user/<int:user_id>/suggestions', methods=['GET'])
+def get_suggestions(user_id):
+    if session.get('user_id') != user_id: return jsonify({'error': 'Forbidden'}), 403
+    tariff = request.args.get('tariff', DEFAULT_TARIFF)
+    if tariff not in TARIFF_PLANS: return jsonify({'error': 'Unknown tariff'}), 400
+    user = User.query.get_or_404(user_id)
+    appliances = repository.get_user_appliances(user_id)
+    forecasts = get_appliance_forecasts(a.appliance_type for a in appliances)
+    with instrumentation.stage('suggestion'):
+        results = generate_suggestions(user, appliances, forecasts, tariff)
+
+    suggestions = []
+    for appliance, result in zip(appliances, results):
+        item = {'appliance_id': appliance.id, 'appliance': f"{appliance.brand} {appliance.model}"}
+        if result is None:
+            item['error'] = 'Could not retrieve forecast'
+        else:
+            item['suggestion'] = result['text']
+            item['savings'] = result['savings']
+        suggestions.append(item)
+
+    return jsonify({'user': user.username, 'suggestions': suggestions})
+
+# Schedules all of the user's appliances together over the next ?hours= (default
+# 24) so their combined load stays under ?peak_kw=, at the lowest total cost.
+@app.route('/user/<int:user_id>/schedule', methods=['GET'])
+def get_household_schedule(user_id):
+    if session.get('user_id') != user_id: return jsonify({'error': 'Forbidden'}), 403
+    tariff = request.args.get('tariff', DEFAULT_TARIFF)
+    if tariff not in TARIFF_PLANS: return jsonify({'error': 'Unknown tariff'}), 400
+    try:
+        peak_kw = float(request.args.get('peak_kw', app.config['HOUSEHOLD_PEAK_KW']))
+        hours = int(request.args.get('hours', 24))
+    except ValueError:
+        return jsonify({'error': 'Invalid peak_kw or hours'}), 400
+    if not peak_kw > 0 or not 1 <= hours <= app.config['SCHEDULE_MAX_HOURS']:
+        return jsonify({'error': f"peak_kw must be positive and hours between 1 and {app.config['SCHEDULE_MAX_HOURS']}"}), 400
+    user = User.query.get_or_404(user_id)
+    appliances = repository.get_user_appliances(user_id)
+    forecasts = get_appliance_forecasts(a.appliance_type for a in appliances)
+    with instrumentation.stage('schedule'):
+        result = schedule_household(appliances, forecasts, peak_kw, tariff, hours, time_budget_ms=app.config['SCHEDULE_TIME_BUDGET_MS'])
+
+    schedule = []
+    for appliance, entry in zip(appliances, result['schedule']):
+        item = {'appliance_id': appliance.id, 'appliance': f"{appliance.brand} {appliance.model}"}
+        if entry is None:
+            item['error'] = 'Does not fit under the peak limit'
+        else:
+            item.update({
+                'start_time': entry['start_time'].isoformat(timespec='minutes'),
+                'end_time': entry['end_time'].isoformat(timespec='minutes'),
+                'cycle_hours': entry['cycle_hours'],
+                'power_kw': round(entry['power_kw'], 2),
+                'cost': round(entry['cost'], 2),
+                'savings': round(entry['savings'], 2),
+            })
+        schedule.append(item)
+
+    return jsonify({
+        'user': user.username,
+        'tariff': tariff,
+        'peak_kw': peak_kw,
+        'hours': hours,
+        'status': result['status'],
+        'total_cost': round(result['total_cost'], 2),
+        'savings': round(result['savings'], 2),
+        'max_load_kw': round(result['max_load_kw'], 2),
+        'schedule': schedule,
+    })
+
+def create_app():
+    """
+    Prepares the app for serving and returns it: makes sure the instance
+    directory exists and adds tables and indexes introduced since the database
+    was created. Used by the development server below and by serve.py.
+    """
     if not os.path.exists(os.path.join(basedir, 'instance')):
         os.makedirs(os.path.join(basedir, 'instance'))
-    app.run(debug=True)
+    with app.app_context():
+        db.create_all()
+        repository.ensure_indexes()
+    return app
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    create_app().run(debug=True)
 
@@ -0,0 +1,170 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from advisor_logic import DEFAULT_TARIFF, TARIFF_PLANS, format_suggestion, score_appliances
+
+# Generates suggestions for every user's appliances, e.g. for daily push or
+# email tips, and writes one JSON line per user in the shape of
+# GET /user/<id>/suggestions. Users are read in pages, each appliance type is
+# forecast once for the whole run, and pages are turned into suggestions by a
+# pool of worker processes:
+#
+#   python batch_suggestions.py suggestions.jsonl
+#   python batch_suggestions.py suggestions.jsonl --resume   # continue an interrupted run
+#
+# The app is imported inside run() rather than here: workers are spawned and
+# re-import this module, and only need advisor_logic.
+
+User = namedtuple('User', 'id username')
+Appliance = namedtuple('Appliance', 'id brand model appliance_type avg_power_consumption_kwh')
+
+# Per worker process, set by _init_worker
+_job = {}
+
+def _init_worker(forecasts, tariff, now):
+    _job.update(forecasts=forecasts, tariff=tariff, now=now, scores={})
+
+def render_page(page):
+    """
+    Returns a page's JSON lines and suggestion count. An appliance's score is
+    the same for every owner, so each one is scored once per worker and only
+    the text is built per user.
+    """
+    scores = _job['scores']
+    new = {}
+    for _, _, appliances in page:
+        for row in appliances:
+            if row[0] not in scores:
+                new[row[0]] = Appliance(*row)
+    if new:
+        scores.update(zip(new, score_appliances(list(new.values()), _job['forecasts'], _job['tariff'], _job['now'])))
+
+    lines = []
+    count = 0
+    for user_id, username, appliances in page:
+        user = User(user_id, username)
+        suggestions = []
+        for row in appliances:
+            appliance = Appliance(*row)
+            item = {'appliance_id': appliance.id, 'appliance': f"{appliance.brand} {appliance.model}"}
+            score = scores[appliance.id]
+            if score is None:
+                item['error'] = 'Could not retrieve forecast'
+            else:
+                result = format_suggestion(user, appliance, score, _job['now'])
+                item['suggestion'] = result['text']
+                item['savings'] = result['savings']
+                count += 1
+            suggestions.append(item)
+        lines.append(json.dumps({'user_id': user_id, 'user': username, 'suggestions': suggestions}, ensure_ascii=False))
+    return ''.join(line + '\n' for line in lines), count
+
+# --- Checkpoints ---
+# After every page written, the checkpoint records the last user written and
+# the output size at that point. Resuming truncates the output back to that
+# size, so lines written after the last checkpoint are not duplicated.
+
+def checkpoint_path(output):
+    return output + '.checkpoint'
+
+def load_checkpoint(output):
+    path = checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(output, checkpoint):
+    path = checkpoint_path(output)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def run(output, tariff=DEFAULT_TARIFF, page_size=1000, workers=None, resume=False):
+    from app import app, get_appliance_forecasts
+    import repository
+
+    checkpoint = load_checkpoint(output) if resume else None
+    if checkpoint is None:
+        checkpoint = {
+            'tariff': tariff,
+            'started_at': datetime.now().isoformat(),
+            'after_user_id': 0,
+            'users': 0,
+            'suggestions': 0,
+            'bytes': 0,
+        }
+    else:
+        size = os.path.getsize(output) if os.path.exists(output) else 0
+        if size < checkpoint['bytes']:
+            print(f"Error: {output} is shorter than its checkpoint says ({size} < {checkpoint['bytes']} bytes). Start over without --resume.")
+            return None
+        # A resumed run keeps the original run's tariff and suggestion times
+        tariff = checkpoint['tariff']
+        print(f"Resuming after user {checkpoint['after_user_id']} ({checkpoint['users']} users written).")
+    now = datetime.fromisoformat(checkpoint['started_at'])
+
+    started = time.perf_counter()
+    with app.app_context():
+        appliance_types = repository.get_owned_appliance_types()
+        forecasts = get_appliance_forecasts(appliance_types)
+        missing = sorted(t for t in appliance_types if not forecasts.get(t))
+        print(f"Forecast {len(appliance_types)} appliance types in {time.perf_counter() - started:.2f}s"
+              + (f"; unavailable: {missing}" if missing else ""))
+        forecasts = {t: values for t, values in forecasts.items() if values}
+
+        with open(output, 'a+b') as out:
+            out.truncate(checkpoint['bytes'])
+            out.seek(checkpoint['bytes'])
+            pages = repository.iter_user_appliance_pages(page_size, checkpoint['after_user_id'])
+
+            def write(page, text, count):
+                out.write(text.encode('utf-8'))
+                out.flush()
+                checkpoint['after_user_id'] = page[-1][0]
+                checkpoint['users'] += len(page)
+                checkpoint['suggestions'] += count
+                checkpoint['bytes'] = out.tell()
+                save_checkpoint(output, checkpoint)
+
+            workers = os.cpu_count() if workers is None else workers
+            if workers <= 1:
+                _init_worker(forecasts, tariff, now)
+                for page in pages:
+                    write(page, *render_page(page))
+            else:
+                # At most two pages per worker are in flight and they are written
+                # in order, so memory stays flat and the checkpoint is a single id.
+                # 'spawn' keeps the app's threads and database connections out of the workers.
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                         initializer=_init_worker, initargs=(forecasts, tariff, now)) as pool:
+                    pending = deque()
+                    for page in pages:
+                        pending.append((page, pool.submit(render_page, page)))
+                        if len(pending) >= 2 * workers:
+                            page, future = pending.popleft()
+                            write(page, *future.result())
+                    while pending:
+                        page, future = pending.popleft()
+                        write(page, *future.result())
+
+    print(f"Wrote suggestions for {checkpoint['users']} users ({checkpoint['suggestions']} suggestions) "
+          f"to {output} in {time.perf_counter() - started:.2f}s")
+    return checkpoint
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate suggestions for every user into a JSON lines file.")
+    parser.add_argument('output', help="JSON lines file to write, one line per user")
+    parser.add_argument('--tariff', choices=sorted(TARIFF_PLANS), default=DEFAULT_TARIFF)
+    parser.add_argument('--page-size', type=int, default=1000, help="users read and processed per page")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPUs; 1 runs inline)")
+    parser.add_argument('--resume', action='store_true', help="continue from the output's checkpoint instead of starting over")
+    args = parser.parse_args()
+    run(args.output, args.tariff, args.page_size, args.workers, args.resume)
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Offline benchmark suite for the forecast, suggestion and API hot paths.
+#
+#   python benchmarks/run_benchmarks.py --scale 10 --output results.json
+#   python benchmarks/run_benchmarks.py --scale 10 --compare results.json --threshold 0.2
+#
+# Each run generates a scaled copy of the dataset and catalog (see
+# synthetic_data.py) in a scratch directory and points the app at it, so the
+# real database and dataset are never touched. Results are latency
+# percentiles per benchmark; --compare exits non-zero if any of them regressed
+# by more than --threshold against an earlier results file.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..'))
+sys.path.insert(0, os.path.join(BASE_DIR, '..', 'ml'))
+import synthetic_data
+
+# Percentiles compared by --compare
+COMPARED_METRICS = ('p50_ms', 'p95_ms')
+
+def summarize(samples, wall_seconds=None):
+    """Latency percentiles (ms) and throughput for a list of durations in seconds."""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    wall_seconds = wall_seconds if wall_seconds is not None else ms.sum() / 1000.0
+    return {
+        'n': int(len(ms)),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'ops_per_s': round(len(ms) / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+
+def measure(fn, repeat, warmup=3, setup=None):
+    """Times `fn()` `repeat` times; `setup()` runs untimed before each call."""
+    for _ in range(warmup):
+        if setup: setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+def prepare_environment(workdir, scale, catalog_scale, users, backend):
+    """Generates the scaled dataset and points the app at the scratch directory."""
+    dataset_path = os.path.join(workdir, 'power_consumption.csv')
+    rows = synthetic_data.scale_dataset(dataset_path, scale)
+    database_path = os.path.join(workdir, 'benchmark.db')
+    # Every run starts from a freshly seeded database
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database_path + suffix):
+            os.remove(database_path + suffix)
+    os.environ['ECOWISE_DATASET_PATH'] = dataset_path
+    os.environ['ECOWISE_DATABASE_URI'] = 'sqlite:///' + database_path
+    os.environ['ECOWISE_INFERENCE_BACKEND'] = backend
+    print(f"Generated {rows} readings ({scale}x) in {workdir}")
+
+    # The app reads its configuration at import, so it is imported only now
+    from app import app, db, timeseries_store
+    with app.app_context():
+        db.create_all()
+        timeseries_store.refresh()
+        usernames = synthetic_data.seed_database(db, timeseries_store.appliance_types(), catalog_scale, users)
+    print(f"Seeded {catalog_scale}x catalog and {len(usernames)} users")
+    return usernames
+
+def run_microbenchmarks(repeat):
+    import advisor_logic
+    from app import app, db, forecast_cache, get_appliance_forecast, model_registry, timeseries_store
+    from models import Appliance, User
+    from train_model import LOOK_BACK, create_dataset
+
+    results = {}
+    # The forecast path reads stored forecasts from the database
+    context = app.app_context()
+    context.push()
+    keys = set(model_registry.available_keys())
+    appliance_type = next((t for t in timeseries_store.appliance_types() if t.lower().replace(' ', '_') in keys), None)
+    if appliance_type is None:
+        print("No saved models found; skipping forecast benchmarks.")
+    else:
+        results['get_appliance_forecast.cold'] = measure(
+            lambda: get_appliance_forecast(appliance_type), max(repeat // 10, 5),
+            setup=lambda: forecast_cache.invalidate(appliance_type))
+        results['get_appliance_forecast.warm'] = measure(lambda: get_appliance_forecast(appliance_type), repeat)
+
+    forecast = list(np.random.default_rng(0).uniform(100, 50000, 24))
+    results['find_cheapest_window'] = measure(lambda: advisor_logic.find_cheapest_window(forecast, 3), repeat)
+
+    user = User.query.filter(User.username.like('bench_user_%')).first()
+    appliances = Appliance.query.limit(16).all()
+    results['generate_suggestion'] = measure(lambda: advisor_logic.generate_suggestion(user, appliances[0], forecast), repeat)
+    forecasts = {a.appliance_type: forecast for a in appliances}
+    results['generate_suggestions.16'] = measure(lambda: advisor_logic.generate_suggestions(user, appliances, forecasts), repeat)
+
+    values = timeseries_store.values(timeseries_store.appliance_types()[0]).reshape(-1, 1)
+    results[f'create_dataset.{len(values)}_rows'] = measure(lambda: create_dataset(values, LOOK_BACK), repeat)
+    context.pop()
+    return results
+
+def run_endpoint_benchmarks(username, repeat):
+    """Single-client latency of each endpoint through the Flask test client."""
+    from app import app
+    client = app.test_client()
+    user_id = client.post('/login', json={'username': username, 'password': 'benchmark'}).get_json()['user_id']
+    appliance_id = client.get(f'/user/{user_id}').get_json()['appliances'][0]['id']
+    endpoints = {
+        'GET /@me': lambda: client.get('/@me'),
+        'GET /appliances': lambda: client.get('/appliances'),
+        'GET /appliances?limit=50': lambda: client.get('/appliances?limit=50'),
+        'GET /user/<id>': lambda: client.get(f'/user/{user_id}'),
+        'GET /user/<id>/stats': lambda: client.get(f'/user/{user_id}/stats'),
+        'GET /user/<id>/appliance/<id>/suggestion': lambda: client.get(f'/user/{user_id}/appliance/{appliance_id}/suggestion'),
+        'GET /user/<id>/suggestions': lambda: client.get(f'/user/{user_id}/suggestions'),
+        'POST /suggestion/accept': lambda: client.post('/suggestion/accept', json={'savings': 1.0}),
+    }
+    return {f'endpoint {name}': measure(call, repeat) for name, call in endpoints.items()}
+
+def run_load(usernames, concurrency, duration):
+    """
+    Simulated users, each on its own thread and test client, log in and then
+    repeat a dashboard + suggestion flow until `duration` seconds have passed.
+    """
+    from app import app
+    latencies = {}  # step -> [seconds]
+    errors = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def timed(step, call):
+        started = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.setdefault(step, []).append(elapsed)
+            if response.status_code >= 500:
+                errors.append(f"{step}: {response.status_code}")
+        return response
+
+    def simulated_user(username):
+        client = app.test_client()
+        user_id = timed('login', lambda: client.post('/login', json={'username': username, 'password': 'benchmark'})).get_json()['user_id']
+        while time.monotonic() < deadline:
+            timed('@me', lambda: client.get('/@me'))
+            profile = timed('profile', lambda: client.get(f'/user/{user_id}')).get_json()
+            timed('stats', lambda: client.get(f'/user/{user_id}/stats'))
+            timed('catalog', lambda: client.get('/appliances'))
+            timed('suggestions', lambda: client.get(f'/user/{user_id}/suggestions'))
+            if profile['appliances']:
+                appliance_id = profile['appliances'][0]['id']
+                timed('suggestion', lambda: client.get(f'/user/{user_id}/appliance/{appliance_id}/suggestion'))
+            timed('accept', lambda: client.post('/suggestion/accept', json={'savings': 1.0}))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=simulated_user, args=(usernames[i % len(usernames)],)) for i in range(concurrency)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    wall = time.perf_counter() - started
+
+    results = {f'load {step}': summarize(samples, wall) for step, samples in latencies.items()}
+    results['load all'] = summarize([s for samples in latencies.values() for s in samples], wall)
+    results['load all']['errors'] = len(errors)
+    if errors:
+        print(f"{len(errors)} server errors during load, e.g. {errors[:3]}")
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline, threshold):
+    """Prints metric changes against a baseline; returns the regressions past `threshold`."""
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            flag = ''
+            if change > threshold:
+                regressions.append((name, metric, before, after, change))
+                flag = '  REGRESSION'
+            print(f"{name:55s} {metric}: {before:10.3f} -> {after:10.3f} ms ({change:+.1%}){flag}")
+    return regressions
+
+def print_results(results):
+    print(f"\n{'benchmark':55s} {'n':>6s} {'p50 ms':>10s} {'p95 ms':>10s} {'p99 ms':>10s} {'ops/s':>10s}")
+    for name, r in results.items():
+        print(f"{name:55s} {r['n']:6d} {r['p50_ms']:10.3f} {r['p95_ms']:10.3f} {r['p99_ms']:10.3f} {r['ops_per_s']:10.1f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the forecast, suggestion and API hot paths.")
+    parser.add_argument('--scale', type=int, default=1, help="dataset size as a multiple of the bundled CSV (e.g. 10, 100, 1000)")
+    parser.add_argument('--catalog-scale', type=int, default=None, help="catalog size multiple (default: --scale)")
+    parser.add_argument('--users', type=int, default=50, help="benchmark users to create")
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'keras'], help="inference backend")
+    parser.add_argument('--repeat', type=int, default=200, help="iterations per microbenchmark")
+    parser.add_argument('--concurrency', type=int, default=8, help="simulated users in the load test")
+    parser.add_argument('--duration', type=float, default=10.0, help="load test duration in seconds")
+    parser.add_argument('--skip-micro', action='store_true')
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--skip-load', action='store_true')
+    parser.add_argument('--workdir', default=None, help="scratch directory (default: a new temporary one)")
+    parser.add_argument('--output', default=None, help="write results as JSON to this file")
+    parser.add_argument('--compare', default=None, help="results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed relative slowdown before --compare fails")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ecowise-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    usernames = prepare_environment(workdir, args.scale, args.catalog_scale or args.scale, args.users, args.backend)
+
+    results = {}
+    if not args.skip_micro:
+        results.update(run_microbenchmarks(args.repeat))
+    if not args.skip_endpoints:
+        results.update(run_endpoint_benchmarks(usernames[0], args.repeat))
+    if not args.skip_load:
+        results.update(run_load(usernames, args.concurrency, args.duration))
+    print_results(results)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'scale': args.scale,
+            'catalog_scale': args.catalog_scale or args.scale,
+            'users': args.users,
+            'backend': args.backend,
+            'concurrency': args.concurrency,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparing against {args.compare} (commit {baseline['meta'].get('commit')}), threshold {args.threshold:.0%}:")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) past {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo regressions.")
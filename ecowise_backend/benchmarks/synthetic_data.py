@@ -0,0 +1,100 @@
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+# Generators that scale the bundled dataset and appliance catalog up for
+# benchmarking. Everything is seeded, so a given scale always produces the
+# same data and benchmark runs stay comparable.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DATASET_PATH = os.path.join(BASE_DIR, '..', 'data', 'power_consumption.csv')
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def scale_dataset(dest_path, factor, source_path=BASE_DATASET_PATH, noise=0.05, seed=0):
+    """
+    Writes the consumption dataset repeated `factor` times to `dest_path`. Each
+    copy follows the previous one in time and its PowerConsumption values are
+    jittered by up to +/-`noise`, so every appliance type gets `factor` times
+    as many readings. Rows are streamed, so large factors need little memory.
+    Returns the number of data rows written.
+    """
+    rng = random.Random(seed)
+    with open(source_path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if row]
+    time_col = header.index('Datetime')
+    value_col = header.index('PowerConsumption')
+    times = [datetime.strptime(row[time_col], DATETIME_FORMAT) for row in rows]
+    span = times[-1] - times[0] + timedelta(hours=1)
+
+    written = 0
+    with open(dest_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(header)
+        for copy in range(factor):
+            offset = span * copy
+            for row, time in zip(rows, times):
+                row = list(row)
+                row[time_col] = (time + offset).strftime(DATETIME_FORMAT)
+                if copy:
+                    row[value_col] = f"{float(row[value_col]) * (1 + rng.uniform(-noise, noise)):.1f}"
+                writer.writerow(row)
+                written += 1
+    return written
+
+def catalog_rows(appliance_types, factor, seed=0):
+    """
+    Yields appliance catalog rows (dicts of Appliance columns): the two sample
+    models create_db.py seeds per type, times `factor`, spread over several brands.
+    """
+    rng = random.Random(seed)
+    brands = ['BrandA', 'BrandB', 'BrandC', 'BrandD', 'BrandE']
+    for appliance_type in appliance_types:
+        for i in range(2 * factor):
+            yield {
+                'brand': brands[i % len(brands)],
+                'model': f"Series {i} {appliance_type}",
+                'appliance_type': appliance_type,
+                'avg_power_consumption_kwh': round(rng.uniform(0.2, 3.0), 1),
+                'avg_water_consumption_liters': 50 if 'Wash' in appliance_type or 'Dish' in appliance_type else None,
+                'has_delay_start': i % 2 == 0,
+                'has_eco_mode': i % 3 != 0,
+            }
+
+def seed_database(db, appliance_types, catalog_factor, users, appliances_per_user=4, password='benchmark', seed=0):
+    """
+    Fills an empty database with a scaled catalog and `users` users, each owning
+    `appliances_per_user` random catalog appliances. Returns the usernames.
+    """
+    from sqlalchemy import insert, select
+    from models import Appliance, User, user_appliances
+    from repository import bump_catalog_version
+
+    rng = random.Random(seed)
+    rows = list(catalog_rows(appliance_types, catalog_factor, seed))
+    for start in range(0, len(rows), 5000):
+        db.session.execute(insert(Appliance), rows[start:start + 5000])
+    bump_catalog_version(db.session.connection())
+    appliance_ids = db.session.scalars(select(Appliance.id)).all()
+
+    # Hashing is deliberately slow, so every benchmark user shares one hash
+    template = User(username='template', location='Benchmark')
+    template.set_password(password)
+    usernames = [f"bench_user_{i}" for i in range(users)]
+    db.session.execute(insert(User), [
+        {'username': name, 'location': 'Benchmark', 'password_hash': template.password_hash,
+         'total_savings': 0.0, 'current_streak': 0}
+        for name in usernames
+    ])
+    user_ids = db.session.scalars(select(User.id).where(User.username.in_(usernames))).all()
+    links = [
+        {'user_id': user_id, 'appliance_id': appliance_id}
+        for user_id in user_ids
+        for appliance_id in rng.sample(appliance_ids, min(appliances_per_user, len(appliance_ids)))
+    ]
+    if links:
+        db.session.execute(insert(user_appliances), links)
+    db.session.commit()
+    return usernames
@@ -1,67 +1,32 @@
-from app import app, db
-from models import Appliance, User
-import pandas as pd
+import argparse
+import json
 import os
 
-# --- Updated function to create appliances based on types found in the synthetic dataset ---
+from app import app, db, DATASET_PATH
+from import_catalog import CATALOG_PATH, dataset_type_stats, import_catalog, import_file, sample_records
+from models import User
+
 def create_appliances():
     """
-    Reads the synthetic usage dataset to find all unique appliance types
-    and creates a few sample models for each type in the database.
-    This populates the KBIS with a diverse range of selectable appliances for the user.
+    Imports the appliance catalog (data/appliances_dataset.csv) and two sample
+    models for every appliance type in the usage dataset. Models are upserted,
+    so running this again updates the catalog without touching users.
     """
-    print("Creating appliances from synthetic dataset types...")
-    
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    # Read the NEW, larger dataset to discover all appliance types
-    file_path = os.path.join(basedir, 'data', 'power_consumption.csv')
-    
-    if not os.path.exists(file_path):
-        print(f"Dataset not found at {file_path}. Cannot create appliances.")
-        return
-
-    df = pd.read_csv(file_path)
-    # Get a list of unique appliance types from the 'Appliance' column, filtering out 'None'
-    appliance_types = df['Appliance'].dropna().unique()
-    
-    print(f"Found appliance types in dataset: {list(appliance_types)}")
-
-    appliances_to_create = []
-
-    # For each discovered type, we create two sample models for users to choose from
-    for appliance_type in appliance_types:
-        # Use the mean power consumption from the dataset as a baseline for our samples
-        # This is a simple heuristic to create somewhat realistic data.
-        mean_power = df[df['Appliance'] == appliance_type]['PowerConsumption'].mean()
-        
-        appliances_to_create.extend([
-            Appliance(
-                brand='BrandA', 
-                model=f'EcoSmart {appliance_type}', 
-                appliance_type=appliance_type, 
-                avg_power_consumption_kwh=round(mean_power / 20000, 1), # Scaled heuristic
-                avg_water_consumption_liters= 50 if 'Wash' in appliance_type or 'Dish' in appliance_type else None,
-                has_delay_start=True, 
-                has_eco_mode=True
-            ),
-            Appliance(
-                brand='BrandB', 
-                model=f'PowerSaver {appliance_type}', 
-                appliance_type=appliance_type, 
-                avg_power_consumption_kwh=round(mean_power / 25000, 1), # Scaled heuristic
-                avg_water_consumption_liters= 60 if 'Wash' in appliance_type or 'Dish' in appliance_type else None,
-                has_delay_start=True, 
-                has_eco_mode=False
-            )
-        ])
+    if os.path.exists(CATALOG_PATH):
+        result = import_file(CATALOG_PATH)
+        print(f"Catalog {CATALOG_PATH}: {json.dumps(result.to_dict(), default=str)}")
+    else:
+        print(f"Catalog not found at {CATALOG_PATH}. Skipping it.")
 
-    if not appliances_to_create:
-        print("No appliances to create.")
+    if not os.path.exists(DATASET_PATH):
+        print(f"Dataset not found at {DATASET_PATH}. Cannot create sample appliances.")
         return
 
-    db.session.bulk_save_objects(appliances_to_create)
-    db.session.commit()
-    print(f"{len(appliances_to_create)} total sample appliances created.")
+    # Per-type statistics in a single pass over the dataset
+    stats = dataset_type_stats(DATASET_PATH)
+    print(f"Found appliance types in dataset: {list(stats)}")
+    result = import_catalog(sample_records(stats), parsed=True)
+    print(f"Sample appliances: {result.added} created, {result.changed} updated, {result.unchanged} unchanged.")
 
 # --- The rest of the file remains the same ---
 def create_initial_user():
@@ -76,16 +41,17 @@ def create_initial_user():
         print("User 'Priya' already exists.")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create the database tables and seed the appliance catalog.")
+    parser.add_argument('--reset', action='store_true', help="drop all tables first, deleting every user and their data")
+    args = parser.parse_args()
+
     with app.app_context():
         print("--- Database Setup Initializing ---")
-        print("Dropping all tables...")
-        db.drop_all()
+        if args.reset:
+            print("Dropping all tables...")
+            db.drop_all()
         print("Creating all tables...")
         db.create_all()
         create_appliances()
         create_initial_user()
         print("--- Database setup complete. ---")
-
-
-
-
@@ -0,0 +1,93 @@
+from concurrent.futures import wait
+
+from micro_batcher import MicroBatcher
+
+
+class InferenceTimeout(TimeoutError):
+    """Raised by `forecast_many` when some types did not finish in time."""
+
+    def __init__(self, results, pending):
+        super().__init__(f"Inference timed out for {pending}")
+        self.results = results  # {type: forecast} of the types that finished
+        self.pending = pending
+
+
+class InferenceService(MicroBatcher):
+    """
+    Runs forecasts on a dedicated worker thread instead of the request threads.
+
+    Callers `submit()` an appliance type and get a Future back. Each batch the
+    worker collects (see MicroBatcher) is grouped by appliance type and the
+    distinct types are handed to `compute_many` in one call. Every caller
+    waiting on a type is resolved with the same result, so concurrent requests
+    share batched model evaluations instead of each running its own.
+
+    With `instrumentation`, the stages timed while computing a batch are set on
+    each of its Futures as `stage_timings`, and `forecast_many` adds them to
+    the calling request's breakdown (and so its Server-Timing header).
+    """
+
+    thread_name = 'inference-worker'
+
+    def __init__(self, compute_many, batch_window_ms=2.0, max_batch=64, instrumentation=None):
+        super().__init__(batch_window_ms, max_batch)
+        self.compute_many = compute_many
+        self.instrumentation = instrumentation
+        self.requests = 0
+        self.batches = 0
+        self.computed_types = 0
+
+    def forecast_many(self, appliance_types, timeout=None):
+        """
+        Submits several types and waits for all of them, up to `timeout`
+        seconds in total; returns {type: forecast}. If some are not done by
+        then, those still queued are cancelled so the worker skips them, and
+        InferenceTimeout is raised carrying the finished forecasts.
+        """
+        futures = {t: self.submit(t) for t in appliance_types}
+        done, not_done = wait(futures.values(), timeout)
+        for future in not_done:
+            future.cancel()
+        if self.instrumentation is not None:
+            # Types computed in the same batch carry the same timings; count them once
+            batches = {id(f.stage_timings): f.stage_timings for f in done}
+            for timings in batches.values():
+                self.instrumentation.record(timings)
+        results = {t: f.result() for t, f in futures.items() if f in done}
+        if not_done:
+            raise InferenceTimeout(results, [t for t, f in futures.items() if f in not_done])
+        return results
+
+    def _process(self, batch):
+        waiters = {}
+        for appliance_type, future in batch:
+            waiters.setdefault(appliance_type, []).append(future)
+        self.requests += len(batch)
+        self.batches += 1
+        self.computed_types += len(waiters)
+        timings = {}
+        try:
+            if self.instrumentation is None:
+                results = self.compute_many(list(waiters))
+            else:
+                with self.instrumentation.collect() as timings:
+                    results = self.compute_many(list(waiters))
+        except Exception as e:
+            for futures in waiters.values():
+                for future in futures:
+                    future.stage_timings = timings
+                    future.set_exception(e)
+            return
+        for appliance_type, futures in waiters.items():
+            for future in futures:
+                future.stage_timings = timings
+                future.set_result(results.get(appliance_type))
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'computed_types': self.computed_types,
+            'queued': self.queued(),
+            'avg_batch_size': round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,256 @@
+import argparse
+import csv
+import io
+import json
+import logging
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import app, db, forecast_cache, timeseries_store
+from models import Reading
+
+logger = logging.getLogger(__name__)
+
+# Streaming ingestion of smart-meter readings in the dataset's schema
+# (Datetime, Temperature, Humidity, WindSpeed, GeneralDiffuseFlows,
+# DiffuseFlows, Appliance, PowerConsumption), from CSV, a JSON array or
+# newline-delimited JSON. Used by POST /readings and from the command line:
+#
+#   python ingest_readings.py readings.csv more_readings.json
+
+# Dataset column -> (Reading attribute, required)
+COLUMNS = {
+    'Datetime': ('datetime', True),
+    'Temperature': ('temperature', False),
+    'Humidity': ('humidity', False),
+    'WindSpeed': ('wind_speed', False),
+    'GeneralDiffuseFlows': ('general_diffuse_flows', False),
+    'DiffuseFlows': ('diffuse_flows', False),
+    'Appliance': ('appliance_type', True),
+    'PowerConsumption': ('power_consumption', True),
+}
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+MAX_REPORTED_ERRORS = 20
+
+
+class IngestResult:
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.not_recorded = 0  # in the dataset, but the copy to the reading table failed
+        self.errors = []  # first MAX_REPORTED_ERRORS (record number, message)
+        self.appliance_types = {}  # appliance type -> rows inserted
+        self.seconds = 0.0
+
+    def reject(self, number, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'record': number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'not_recorded': self.not_recorded,
+            'errors': self.errors,
+            'appliance_types': self.appliance_types,
+            'seconds': round(self.seconds, 3),
+        }
+
+# --- Parsing ---
+
+def iter_csv_records(text_stream):
+    """Yields one dict per CSV row, reading the stream line by line."""
+    for row in csv.DictReader(text_stream):
+        yield row
+
+def iter_json_records(binary_stream, chunk_size=64 * 1024):
+    """
+    Yields the objects of a JSON array (or of newline-delimited JSON) while
+    reading the stream in chunks, so a large upload is never held in memory
+    as a whole.
+    """
+    decoder = json.JSONDecoder()
+    reader = io.TextIOWrapper(binary_stream, encoding='utf-8') if not isinstance(binary_stream, io.TextIOBase) else binary_stream
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        # Skip whitespace and the array's brackets and commas between records
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = reader.read(chunk_size), 0
+            eof = not buffer
+            continue
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError(f"Malformed JSON near: {buffer[position:position + 40]!r}")
+            # The record continues in the next chunk
+            chunk = reader.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        position = end
+        yield record
+
+def dataset_timezone(name):
+    if name.upper() == 'UTC':
+        return dt_timezone.utc
+    from zoneinfo import ZoneInfo  # Python 3.9+
+    return ZoneInfo(name)
+
+def parse_record(record, timezone):
+    """
+    Validates a record keyed by dataset column and returns Reading column
+    values. A Datetime with a UTC offset is converted to `timezone`, the
+    dataset's zone, before the offset is dropped; naive ones are taken as
+    already in it.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    values = {}
+    for column, (attribute, required) in COLUMNS.items():
+        raw = record.get(column)
+        if raw is None or raw == '':
+            if required:
+                raise ValueError(f"missing {column}")
+            values[attribute] = None
+            continue
+        if attribute == 'datetime':
+            try:
+                text = str(raw)
+                # fromisoformat only accepts a 'Z' suffix from Python 3.11
+                moment = datetime.fromisoformat(text[:-1] + '+00:00' if text.endswith('Z') else text)
+            except ValueError:
+                raise ValueError(f"invalid Datetime {raw!r}")
+            if moment.tzinfo is not None:
+                moment = moment.astimezone(timezone)
+            values[attribute] = moment.replace(tzinfo=None)
+        elif attribute == 'appliance_type':
+            values[attribute] = str(raw).strip()
+            if not values[attribute] or len(values[attribute]) > 80:
+                raise ValueError(f"invalid Appliance {raw!r}")
+        else:
+            try:
+                number = float(raw)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid {column} {raw!r}")
+            if not math.isfinite(number):
+                raise ValueError(f"invalid {column} {raw!r}")
+            values[attribute] = number
+    if values['power_consumption'] < 0:
+        raise ValueError("PowerConsumption must not be negative")
+    return values
+
+# --- Writing ---
+
+def ingest(records, batch_size=5000):
+    """
+    Validates `records` (dicts keyed by dataset column) and adds them in
+    batches of `batch_size`. The consumption dataset is the record of truth:
+    each batch is appended to it in time order, readings it already holds are
+    skipped as duplicates, so retries are safe, and readings older than their
+    appliance type's latest one are rejected. Appended and duplicate readings
+    are then copied into the `reading` table in one transaction, leaving rows
+    it already has alone, so a retry fills in a copy that failed; failed
+    copies are counted in `not_recorded`. Only the appliance types that
+    received readings are invalidated in the forecast cache.
+    """
+    result = IngestResult()
+    started = time.perf_counter()
+    timezone = dataset_timezone(app.config['DATASET_TIMEZONE'])
+    batch = []
+    try:
+        for number, record in enumerate(records, start=1):
+            result.received += 1
+            try:
+                batch.append((number, parse_record(record, timezone)))
+            except ValueError as e:
+                result.reject(number, str(e))
+                continue
+            if len(batch) >= batch_size:
+                _write_batch(batch, result)
+                batch = []
+    except (ValueError, csv.Error) as e:
+        # The input itself is unreadable from here on; keep what was parsed so far
+        result.reject(result.received + 1, f"unreadable input: {e}")
+    if batch:
+        _write_batch(batch, result)
+    result.seconds = time.perf_counter() - started
+    return result
+
+def _write_batch(batch, result):
+    # Within a batch the last copy of a reading wins, as the dataset keeps only one
+    unique = list({(r['appliance_type'], r['datetime']): (number, r) for number, r in batch}.values())
+    result.duplicates += len(batch) - len(unique)
+    appended, duplicates, stale = timeseries_store.append_new_readings([
+        {column: (r[attribute].strftime(DATETIME_FORMAT) if attribute == 'datetime' else r[attribute])
+         for column, (attribute, _) in COLUMNS.items()}
+        for _, r in unique
+    ])
+    result.inserted += len(appended)
+    result.duplicates += len(duplicates)
+    for i in stale:
+        number, r = unique[i]
+        result.reject(number, f"{r['appliance_type']} reading at {r['datetime']} is older than the latest one stored")
+
+    # Duplicates are copied too (existing rows are left alone), so a retry
+    # fills in readings an earlier failed copy, or the bundled CSV, left out
+    recorded = [unique[i] for i in appended + duplicates]
+    if recorded:
+        try:
+            db.session.execute(sqlite_insert(Reading).on_conflict_do_nothing(index_elements=['appliance_type', 'datetime']),
+                               [r for _, r in recorded])
+            db.session.commit()
+        except SQLAlchemyError as e:
+            # The readings are in the dataset already, which is what forecasts use
+            db.session.rollback()
+            logger.exception("Could not copy %d readings to the reading table", len(recorded))
+            result.not_recorded += len(recorded)
+            if len(result.errors) < MAX_REPORTED_ERRORS:
+                result.errors.append({'record': recorded[0][0], 'error': f"not recorded in the reading table, retry: {e.__class__.__name__}"})
+    if not appended:
+        return
+
+    rows = [unique[i][1] for i in appended]
+    affected = {}
+    for row in rows:
+        affected[row['appliance_type']] = affected.get(row['appliance_type'], 0) + 1
+    for appliance_type, count in affected.items():
+        result.appliance_types[appliance_type] = result.appliance_types.get(appliance_type, 0) + count
+        # The cache would also notice the new series version; dropping the
+        # entries frees them right away.
+        forecast_cache.invalidate(appliance_type)
+
+def ingest_file(path, batch_size=5000):
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            return ingest(iter_csv_records(f), batch_size)
+    with open(path, 'rb') as f:
+        return ingest(iter_json_records(f), batch_size)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest meter readings from CSV, JSON or NDJSON files.")
+    parser.add_argument('paths', nargs='+', help="files to ingest (.csv, or JSON / NDJSON otherwise)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="readings per insert transaction")
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        for path in args.paths:
+            result = ingest_file(path, args.batch_size)
+            print(f"{path}: {json.dumps(result.to_dict())}")
@@ -0,0 +1,333 @@
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Buckets in seconds, from sub-millisecond stages up to slow requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, per label set."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket', labels + (('le', le),), cumulative
+            yield f'{self.name}_count', labels, cumulative
+            yield f'{self.name}_sum', labels, values[-1]
+
+
+class MetricsRegistry:
+    """
+    Holds counters and histograms, plus collectors: callables returned values
+    are read at scrape time, e.g. cache and registry stats() that are already
+    tracked elsewhere. Renders everything in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """`collect()` returns [(name, type, documentation, [(labels dict, value), ...]), ...]."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, metric_type, documentation, samples in families:
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    """
+    Samples the stacks of threads that are serving requests every
+    `interval_ms`. When a request ends after more than `budget_ms`, the stacks
+    sampled during it are returned (and logged by Instrumentation); faster
+    requests just discard theirs. The sampler thread only runs while enabled.
+    """
+
+    def __init__(self, budget_ms, interval_ms=5.0, max_depth=40):
+        self.budget = budget_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self.max_depth = max_depth
+        self._active = {}  # thread ident -> Counter of stacks
+        self._sampler = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start_request(self):
+        self._ensure_sampler()
+        with self._lock:
+            self._active[threading.get_ident()] = StackCounter()
+
+    def end_request(self, elapsed):
+        """Returns the sampled stacks if the request ran over budget, else None."""
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if elapsed < self.budget or not stacks:
+            return None
+        return stacks
+
+    def _ensure_sampler(self):
+        # Threads do not survive fork(), so a forked server worker starts its own
+        if self._sampler is not None and self._pid == os.getpid() and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler is None or self._pid != os.getpid() or not self._sampler.is_alive():
+                self._active = {}
+                self._pid = os.getpid()
+                self._sampler = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._sampler.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._stack(frame)] += 1
+
+    def _stack(self, frame):
+        entries = []
+        while frame is not None and len(entries) < self.max_depth:
+            code = frame.f_code
+            entries.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+            frame = frame.f_back
+        return tuple(reversed(entries))
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with serialization timed as the 'serialize' stage."""
+
+    instrumentation = None
+
+    def dumps(self, obj, **kwargs):
+        if self.instrumentation is None:
+            return super().dumps(obj, **kwargs)
+        with self.instrumentation.stage('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+class Instrumentation:
+    """
+    Per-request timing for the forecast and suggestion path.
+
+    Code wraps its stages in `with instrumentation.stage('predict'):`; each
+    stage is recorded in a histogram and, inside a request, added to that
+    request's breakdown. SQL statements are counted and timed through
+    SQLAlchemy cursor events. With `timing_header` every response carries the
+    breakdown in a Server-Timing header, and with `slow_request_ms` requests
+    over that budget have their sampled stacks logged.
+
+    Stages that run on a worker thread on behalf of requests are gathered with
+    `collect()` and added to each waiting request with `record()`.
+    """
+
+    def __init__(self, registry=None, timing_header=False, slow_request_ms=0, profile_interval_ms=5.0):
+        self.registry = registry or MetricsRegistry()
+        self.timing_header = timing_header
+        self.profiler = SlowRequestProfiler(slow_request_ms, profile_interval_ms) if slow_request_ms else None
+        self.request_seconds = self.registry.histogram(
+            'ecowise_request_duration_seconds', 'Time spent handling requests.', ('endpoint', 'method', 'status'))
+        self.requests_total = self.registry.counter(
+            'ecowise_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.stage_seconds = self.registry.histogram(
+            'ecowise_stage_duration_seconds', 'Time spent in each stage of request handling.', ('stage',))
+        self.db_query_seconds = self.registry.histogram(
+            'ecowise_db_query_duration_seconds', 'Time spent executing SQL statements.')
+        self.db_queries_per_request = self.registry.histogram(
+            'ecowise_db_queries_per_request', 'SQL statements executed per request.', ('endpoint',),
+            buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100))
+        self.errors_total = self.registry.counter(
+            'ecowise_errors_total', 'Errors by the component they were handled in.', ('component', 'reason'))
+        self.slow_requests_total = self.registry.counter(
+            'ecowise_slow_requests_total', 'Requests that exceeded the profiling latency budget.', ('endpoint',))
+        self._local = threading.local()
+
+    def init_app(self, app, engine):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        provider = TimedJSONProvider(app)
+        provider.instrumentation = self
+        app.json = provider
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stage_seconds.observe(elapsed, stage=name)
+            collected = getattr(self._local, 'timings', None)
+            if collected is not None:
+                collected[name] = collected.get(name, 0.0) + elapsed
+            elif has_request_context() and hasattr(g, '_timings'):
+                g._timings[name] = g._timings.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def collect(self):
+        """
+        Gathers the stages run on this thread inside the block into the
+        yielded dict of stage -> seconds instead of the current request, e.g.
+        on a worker thread serving a batch for several requests.
+        """
+        outer = getattr(self._local, 'timings', None)
+        self._local.timings = timings = {}
+        try:
+            yield timings
+        finally:
+            self._local.timings = outer
+
+    def record(self, timings):
+        """Adds stage timings collected elsewhere to the current request's breakdown."""
+        if timings and has_request_context() and hasattr(g, '_timings'):
+            for name, seconds in timings.items():
+                g._timings[name] = g._timings.get(name, 0.0) + seconds
+
+    def error(self, component, reason):
+        self.errors_total.inc(component=component, reason=reason)
+
+    def _before_request(self):
+        g._request_started = time.perf_counter()
+        g._timings = {}
+        g._db_queries = 0
+        if self.profiler is not None:
+            self.profiler.start_request()
+
+    def _after_request(self, response):
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)}
+        self.request_seconds.observe(elapsed, **labels)
+        self.requests_total.inc(**labels)
+        self.db_queries_per_request.observe(g._db_queries, endpoint=endpoint)
+
+        if self.timing_header:
+            parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in g._timings.items()]
+            parts.append(f'db;desc="{g._db_queries} queries";dur={g.get("_db_seconds", 0.0) * 1000:.2f}')
+            parts.append(f'total;dur={elapsed * 1000:.2f}')
+            response.headers['Server-Timing'] = ', '.join(parts)
+
+        if self.profiler is not None:
+            stacks = self.profiler.end_request(elapsed)
+            if stacks:
+                self.slow_requests_total.inc(endpoint=endpoint)
+                top = '\n'.join(f"  {count:4d} samples: {' > '.join(stack[-6:])}" for stack, count in stacks.most_common(5))
+                logger.warning("Slow request %s %s took %.0f ms (%s); most sampled stacks:\n%s",
+                               request.method, request.path, elapsed * 1000,
+                               ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in g._timings.items()), top)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['_query_started'].pop()
+        self.db_query_seconds.observe(elapsed)
+        if has_request_context() and hasattr(g, '_db_queries'):
+            g._db_queries += 1
+            g._db_seconds = g.get('_db_seconds', 0.0) + elapsed
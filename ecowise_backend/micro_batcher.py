@@ -0,0 +1,69 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Hands work submitted from request threads to one worker thread in batches.
+
+    Callers `submit()` an item and get a Future back. The worker takes the
+    first pending item, keeps collecting for up to `batch_window_ms` (or until
+    `max_batch` items are queued) and passes the batch to `_process`, which
+    subclasses implement to resolve every (item, future) pair in it. Futures
+    cancelled while still queued are skipped.
+    """
+
+    thread_name = 'micro-batcher'
+
+    def __init__(self, batch_window_ms, max_batch):
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._worker = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so a forked server worker starts its own
+        if self._worker is not None and self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid() or not self._worker.is_alive():
+                if self._pid != os.getpid():
+                    # Items queued in the parent process have no worker here
+                    self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch):
+        raise NotImplementedError
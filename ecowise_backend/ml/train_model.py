@@ -1,26 +1,155 @@
 
-import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import argparse
+import json
+import multiprocessing
 import os
 import pickle
+import sys
+import time
+
+# The shared time-series store lives in the backend package one level up
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, '..'))
+from timeseries_store import TimeSeriesStore
+from model_registry import DIRECT, RECURSIVE, metadata_path, publish
 
 # --- Configuration ---
-DATASET_PATH = os.path.join('..', 'data', 'power_consumption.csv')
-MODEL_SAVE_DIR ='saved_model'
+DATASET_PATH = os.path.join(BASE_DIR, '..', 'data', 'power_consumption.csv')
+MODEL_SAVE_DIR = os.path.join(BASE_DIR, 'saved_model')
+MANIFEST_NAME = 'training_manifest.json'
 LOOK_BACK = 24
+# Hours a direct model predicts in one forward pass
+HORIZON = 24
+EPOCHS = 10
+INCREMENTAL_EPOCHS = 3
 
 def create_dataset(dataset, look_back=1):
-    dataX, dataY = [], []
-    for i in range(len(dataset) - look_back - 1):
-        a = dataset[i:(i + look_back), 0]
-        dataX.append(a)
-        dataY.append(dataset[i + look_back, 0])
-    return np.array(dataX), np.array(dataY)
-
-def train():
+    """
+    Builds (window, next value) training pairs. The windows are a read-only
+    sliding-window view over `dataset`, so no per-window copies are made.
+    """
+    series = np.asarray(dataset)[:, 0]
+    count = max(len(series) - look_back - 1, 0)
+    if count == 0:
+        return np.empty((0, look_back), dtype=series.dtype), np.empty(0, dtype=series.dtype)
+    return sliding_window_view(series, look_back)[:count], series[look_back:look_back + count]
+
+def create_multi_step_dataset(dataset, look_back=1, horizon=1):
+    """
+    Builds (window, next `horizon` values) training pairs for direct models.
+    Windows and targets are both read-only views over `dataset`.
+    """
+    series = np.asarray(dataset)[:, 0]
+    count = max(len(series) - look_back - horizon + 1, 0)
+    if count == 0:
+        return np.empty((0, look_back), dtype=series.dtype), np.empty((0, horizon), dtype=series.dtype)
+    return sliding_window_view(series, look_back)[:count], sliding_window_view(series[look_back:], horizon)[:count]
+
+def context_rows(kind):
+    """Rows before the first new reading an incremental run needs for full training pairs."""
+    return LOOK_BACK + (HORIZON - 1 if kind == DIRECT else 1)
+
+def _limit_threads(threads):
+    """Caps BLAS and TensorFlow threads in a training worker process."""
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ[var] = str(threads)
+    # NumPy's BLAS is already loaded by the time this runs, so limit it directly
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def _save_atomically(model, scaler, metadata, appliance_key):
+    model_path = os.path.join(MODEL_SAVE_DIR, f"{appliance_key}_model.h5")
+    scaler_path = os.path.join(MODEL_SAVE_DIR, f"{appliance_key}_scaler.pkl")
+    meta_path = metadata_path(MODEL_SAVE_DIR, appliance_key)
+    # Write to temporary files and publish them as one swap, so a server
+    # hot-reloading from this directory never reads a half-written file or a
+    # model with another version's scaler.
+    model.save(model_path + '.tmp.h5')
+    with open(scaler_path + '.tmp', 'wb') as f:
+        pickle.dump(scaler, f)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    publish(MODEL_SAVE_DIR, appliance_key, [
+        (meta_path + '.tmp', meta_path),
+        (scaler_path + '.tmp', scaler_path),
+        (model_path + '.tmp.h5', model_path),
+    ])
+    return model_path
+
+def train_appliance(appliance_type, values, warm_start, epochs, kind=DIRECT):
+    """
+    Trains one appliance type's model in a worker process. With `warm_start`
+    the existing model and scaler are loaded and trained further on `values`
+    (the newest rows); otherwise a fresh model is trained on the full series.
+    A DIRECT model outputs the next HORIZON values at once, a RECURSIVE one
+    only the next value. Returns the manifest entry for this run, or None if
+    it was skipped.
+    """
+    from sklearn.preprocessing import MinMaxScaler
+    from tensorflow.keras.models import Sequential, load_model
+    from tensorflow.keras.layers import Input, LSTM, Dense
+
+    started = time.perf_counter()
+    appliance_key = appliance_type.lower().replace(' ', '_')
+    power_data = values.reshape(-1, 1)
+
+    if warm_start:
+        model = load_model(os.path.join(MODEL_SAVE_DIR, f"{appliance_key}_model.h5"))
+        with open(os.path.join(MODEL_SAVE_DIR, f"{appliance_key}_scaler.pkl"), 'rb') as f:
+            scaler = pickle.load(f)
+        scaled_data = scaler.transform(power_data)
+    else:
+        scaler = MinMaxScaler(feature_range=(0, 1))
+        scaled_data = scaler.fit_transform(power_data)
+        model = Sequential([ Input(shape=(LOOK_BACK, 1)), LSTM(50), Dense(HORIZON if kind == DIRECT else 1) ])
+    model.compile(loss='mean_squared_error', optimizer='adam')
+
+    if kind == DIRECT:
+        trainX, trainY = create_multi_step_dataset(scaled_data, LOOK_BACK, HORIZON)
+    else:
+        trainX, trainY = create_dataset(scaled_data, LOOK_BACK)
+    if len(trainX) == 0:
+        print(f"Could not create training samples for {appliance_type}. Skipping.")
+        return None
+    trainX = trainX[..., np.newaxis]
+
+    print(f"Training {appliance_type} {kind} model ({'incremental' if warm_start else 'full'}, {len(trainX)} samples)...")
+    history = model.fit(trainX, trainY, epochs=epochs, batch_size=32, verbose=0)
+    metadata = {'kind': kind, 'look_back': LOOK_BACK, 'horizon': HORIZON if kind == DIRECT else 1}
+    model_path = _save_atomically(model, scaler, metadata, appliance_key)
+    print(f"Successfully saved model to: {model_path}")
+
+    return {
+        'appliance_type': appliance_type,
+        'kind': kind,
+        'mode': 'incremental' if warm_start else 'full',
+        'samples': len(trainX),
+        'epochs': epochs,
+        'loss': float(history.history['loss'][-1]),
+        'duration_s': round(time.perf_counter() - started, 3),
+    }
+
+def load_manifest():
+    path = os.path.join(MODEL_SAVE_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'models': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    path = os.path.join(MODEL_SAVE_DIR, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def train(incremental=False, workers=None, threads_per_worker=1, epochs=None, appliance_types=None, kind=DIRECT):
     print("--- Starting Multi-Model Training Process ---")
 
     if not os.path.exists(DATASET_PATH):
@@ -28,58 +157,89 @@ def train():
         return
 
     print("Loading synthetic dataset...")
-    df = pd.read_csv(DATASET_PATH)
-    
-    appliance_types = df['Appliance'].dropna().unique()
+    store = TimeSeriesStore(DATASET_PATH).load()
+
+    appliance_types = appliance_types or store.appliance_types()
     print(f"Found appliance types to train models for: {list(appliance_types)}")
 
     if not os.path.exists(MODEL_SAVE_DIR):
         os.makedirs(MODEL_SAVE_DIR)
 
+    manifest = load_manifest()
+    run_started = time.perf_counter()
+    jobs = {}  # appliance_type -> (values, warm_start, epochs, data range)
     for appliance_type in appliance_types:
-        print(f"\n--- Training model for: {appliance_type} ---")
-        
-        appliance_df = df[df['Appliance'] == appliance_type]
-        power_data = appliance_df[['PowerConsumption']].values.astype('float32')
+        appliance_key = appliance_type.lower().replace(' ', '_')
+        values = store.values(appliance_type)
+        times = store.times(appliance_type)
 
-        if len(power_data) < LOOK_BACK + 2:
+        if len(values) < context_rows(kind) + 1:
             print(f"Not enough data for {appliance_type} to create a model. Skipping.")
             continue
 
-        scaler = MinMaxScaler(feature_range=(0, 1))
-        scaled_data = scaler.fit_transform(power_data)
+        previous = manifest['models'].get(appliance_key)
+        model_exists = os.path.exists(os.path.join(MODEL_SAVE_DIR, f"{appliance_key}_model.h5"))
+        # A model of another kind has a different output layer, so it is retrained from scratch
+        warm_start = bool(incremental and previous and model_exists and previous.get('kind', RECURSIVE) == kind)
+        if warm_start:
+            trained_rows = previous['data_rows']
+            if trained_rows >= len(values):
+                print(f"{appliance_type} is up to date ({trained_rows} rows). Skipping.")
+                continue
+            # Keep enough earlier rows that the first new reading is part of a full training pair
+            values = values[max(trained_rows - context_rows(kind), 0):]
+        jobs[appliance_type] = (
+            np.ascontiguousarray(values),
+            warm_start,
+            epochs or (INCREMENTAL_EPOCHS if warm_start else EPOCHS),
+            {'data_rows': len(store.values(appliance_type)), 'data_from': str(times[0]), 'data_to': str(times[-1])},
+        )
 
-        trainX, trainY = create_dataset(scaled_data, LOOK_BACK)
-        
-        if len(trainX) == 0:
-            print(f"Could not create training samples for {appliance_type}. Skipping.")
-            continue
-            
-        trainX = np.reshape(trainX, (trainX.shape[0], trainX.shape[1], 1))
-        
-        model = Sequential([ LSTM(50, input_shape=(LOOK_BACK, 1)), Dense(1) ])
-        model.compile(loss='mean_squared_error', optimizer='adam')
-        
-        print(f"Training {appliance_type} model...")
-        model.fit(trainX, trainY, epochs=10, batch_size=32, verbose=0)
-
-        # --- THIS IS THE FIX ---
-        # Create a standardized, lowercase key for filenames (e.g., 'ev_charger')
-        appliance_key = appliance_type.lower().replace(' ', '_')
-        model_name = f"{appliance_key}_model.h5"
-        scaler_name = f"{appliance_key}_scaler.pkl"
-        
-        model_path = os.path.join(MODEL_SAVE_DIR, model_name)
-        scaler_path = os.path.join(MODEL_SAVE_DIR, scaler_name)
-        
-        model.save(model_path)
-        with open(scaler_path, 'wb') as f:
-            pickle.dump(scaler, f)
-            
-        print(f"Successfully saved model to: {model_path}")
+    if jobs:
+        workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        # 'spawn' gives every worker a fresh interpreter, so TensorFlow is never
+        # initialised before a fork and the thread limits apply from the start.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context,
+                                 initializer=_limit_threads, initargs=(threads_per_worker,)) as pool:
+            futures = {
+                pool.submit(train_appliance, appliance_type, values, warm_start, job_epochs, kind): appliance_type
+                for appliance_type, (values, warm_start, job_epochs, _) in jobs.items()
+            }
+            for future in as_completed(futures):
+                appliance_type = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    print(f"Training failed for {appliance_type}: {e}")
+                    continue
+                if entry is None:
+                    continue
+                entry.update(jobs[appliance_type][3])
+                entry['trained_at'] = datetime.utcnow().isoformat()
+                manifest['models'][appliance_type.lower().replace(' ', '_')] = entry
+
+    manifest['last_run'] = {
+        'finished_at': datetime.utcnow().isoformat(),
+        'incremental': incremental,
+        'kind': kind,
+        'trained': sorted(jobs),
+        'duration_s': round(time.perf_counter() - run_started, 3),
+    }
+    save_manifest(manifest)
 
     print("\n--- All Model Training Complete! ---")
 
 if __name__ == '__main__':
-    train()
-
+    parser = argparse.ArgumentParser(description="Train one forecasting model per appliance type.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="warm-start existing models on rows added since the last run")
+    parser.add_argument('--workers', type=int, default=None, help="training processes (default: CPUs / threads)")
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="CPU threads each process may use")
+    parser.add_argument('--epochs', type=int, default=None,
+                        help=f"default {EPOCHS} for full runs, {INCREMENTAL_EPOCHS} for incremental ones")
+    parser.add_argument('--types', nargs='*', default=None, help="appliance types to train (default: all)")
+    parser.add_argument('--kind', choices=[DIRECT, RECURSIVE], default=DIRECT,
+                        help=f"{DIRECT}: predict all {HORIZON} hours in one pass (default); {RECURSIVE}: one-step model rolled out autoregressively")
+    args = parser.parse_args()
+    train(args.incremental, args.workers, args.threads_per_worker, args.epochs, args.types, args.kind)
@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Model kinds, declared in the `<appliance_key>_model.json` file saved next to
+# each model. A recursive model predicts one step and is rolled out
+# autoregressively; a direct model predicts the whole horizon in one pass.
+RECURSIVE = 'recursive'
+DIRECT = 'direct'
+# Models trained before the metadata file existed are one-step LSTMs
+LEGACY_METADATA = {'kind': RECURSIVE, 'look_back': 24, 'horizon': 1}
+
+def metadata_path(model_dir, appliance_key):
+    return os.path.join(model_dir, f"{appliance_key}_model.json")
+
+def load_metadata(model_dir, appliance_key):
+    """The metadata saved with a model, or LEGACY_METADATA if it has none."""
+    try:
+        with open(metadata_path(model_dir, appliance_key)) as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return dict(LEGACY_METADATA)
+    if metadata.get('kind') not in (RECURSIVE, DIRECT):
+        raise ValueError(f"Unknown model kind: {metadata.get('kind')!r}")
+    return {**LEGACY_METADATA, **metadata}
+
+# Training swaps a model's files in as a unit (see publish()). Its stamp file
+# is marked not ready before the first file is replaced and gets a new version
+# after the last one, so a registry that saw the same ready stamp before and
+# after loading has read one consistent set of files.
+#
+# A publish takes milliseconds; a stamp left not ready for longer than this was
+# abandoned by a trainer that died mid-swap, and the model is then versioned by
+# its file times like one saved without a stamp, until the next publish.
+STALE_STAMP_SECONDS = 60.0
+
+def stamp_path(model_dir, appliance_key):
+    return os.path.join(model_dir, f"{appliance_key}_model.stamp")
+
+def read_stamp(model_dir, appliance_key):
+    """The model's stamp ({'version', 'ready'}), or None for models saved without one."""
+    try:
+        with open(stamp_path(model_dir, appliance_key)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_stamp(model_dir, appliance_key, version, ready):
+    path = stamp_path(model_dir, appliance_key)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': version, 'ready': ready}, f)
+    os.replace(path + '.tmp', path)
+
+def publish(model_dir, appliance_key, replacements):
+    """
+    Moves (temporary path, final path) pairs into place as one new version of
+    the model, bracketed by its stamp so the registry never loads a mix of old
+    and new files.
+    """
+    stamp = read_stamp(model_dir, appliance_key)
+    _write_stamp(model_dir, appliance_key, stamp and stamp['version'], False)
+    for temporary, final in replacements:
+        os.replace(temporary, final)
+    _write_stamp(model_dir, appliance_key, str(time.time_ns()), True)
+
+# Returned by _read_signature while a model's files are being replaced
+SWAPPING = object()
+
+
+class ModelRegistry:
+    """
+    Loads appliance models and scalers from `model_dir` on first use.
+
+    At most `max_resident` appliance models are kept in memory; the least
+    recently used one is dropped when another has to be loaded. Every
+    `check_interval` seconds a lookup re-checks the model's stamp (see
+    publish()), and if the model was replaced (e.g. by a retraining run) the new
+    model, scaler and metadata are loaded and swapped in as a whole. A load
+    that overlaps a replacement is discarded, so callers never see a new model
+    with an old scaler. Models saved without a stamp are versioned by the
+    modification times of their model and scaler files instead, as are models
+    whose stamp went stale (see STALE_STAMP_SECONDS).
+
+    TensorFlow is only imported when the first Keras model is loaded.
+    """
+
+    def __init__(self, model_dir, backend='keras', max_resident=32, check_interval=5.0):
+        self.model_dir = model_dir
+        self.backend = backend
+        self.max_resident = max_resident
+        self.check_interval = check_interval
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.load_seconds = {}  # appliance_key -> duration of the latest load
+        self._entries = OrderedDict()  # appliance_key -> (signature, model, scaler, metadata)
+        self._checked_at = {}  # appliance_key -> (monotonic time, signature)
+        self._loading = {}  # appliance_key -> threading.Lock
+        self._lock = threading.Lock()
+
+    def paths(self, appliance_key):
+        return (
+            os.path.join(self.model_dir, f"{appliance_key}_model.h5"),
+            os.path.join(self.model_dir, f"{appliance_key}_scaler.pkl"),
+        )
+
+    def available_keys(self):
+        """Appliance keys that have a model on disk, whether loaded or not."""
+        if not os.path.exists(self.model_dir):
+            return []
+        return sorted(f[:-len("_model.h5")] for f in os.listdir(self.model_dir) if f.endswith("_model.h5"))
+
+    def signature(self, appliance_key):
+        """
+        Identifies the current version of a model, re-checking the disk at most
+        every `check_interval` seconds. None if it is missing. While its files
+        are being replaced the version seen before is kept.
+        """
+        now = time.monotonic()
+        checked = self._checked_at.get(appliance_key)
+        if checked is not None and now - checked[0] < self.check_interval:
+            return checked[1]
+        signature = self._read_signature(appliance_key)
+        if signature is SWAPPING:
+            signature = checked[1] if checked is not None else None
+        self._checked_at[appliance_key] = (now, signature)
+        return signature
+
+    def _read_signature(self, appliance_key):
+        try:
+            stamp = read_stamp(self.model_dir, appliance_key)
+            if stamp is not None:
+                if stamp['ready']:
+                    return ('stamp', stamp['version'])
+                age = time.time() - os.stat(stamp_path(self.model_dir, appliance_key)).st_mtime
+                if age < STALE_STAMP_SECONDS:
+                    return SWAPPING
+            stats = [os.stat(path) for path in self.paths(appliance_key)]
+            return tuple((st.st_mtime_ns, st.st_size) for st in stats)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def version_tag(self, appliance_key):
+        """The model's current version as a string, e.g. for stored forecasts; None if it is missing."""
+        signature = self.signature(appliance_key)
+        if signature is None:
+            return None
+        if signature[0] == 'stamp':
+            return signature[1]
+        (model_mtime, model_size), (scaler_mtime, scaler_size) = signature
+        return f"{model_mtime}-{model_size}/{scaler_mtime}-{scaler_size}"
+
+    def get(self, appliance_key):
+        """Returns (model, scaler) for an appliance key, or (None, None) if unavailable."""
+        return self.get_with_metadata(appliance_key)[:2]
+
+    def get_with_metadata(self, appliance_key):
+        """
+        Returns (model, scaler, metadata) for an appliance key, or
+        (None, None, None) if unavailable. See load_metadata.
+        """
+        signature = self.signature(appliance_key)
+        if signature is None:
+            return None, None, None
+        with self._lock:
+            entry = self._entries.get(appliance_key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(appliance_key)
+                return entry[1:]
+            loading = self._loading.setdefault(appliance_key, threading.Lock())
+
+        # One thread loads a given key; others wait for it rather than loading
+        # the same files again.
+        with loading:
+            with self._lock:
+                entry = self._entries.get(appliance_key)
+                if entry is not None and entry[0] == signature:
+                    self._entries.move_to_end(appliance_key)
+                    return entry[1:]
+            try:
+                started = time.perf_counter()
+                model, scaler, metadata = self._load(appliance_key)
+                duration = time.perf_counter() - started
+            except Exception:
+                logger.exception("Error loading model files for '%s'", appliance_key)
+                return None, None, None
+            if self._read_signature(appliance_key) != signature:
+                # The files were replaced while we read them; keep serving the
+                # previous version and load the new one on a later lookup.
+                logger.info("Model files for '%s' changed while loading; not using them", appliance_key)
+                with self._lock:
+                    entry = self._entries.get(appliance_key)
+                if entry is None:
+                    self._checked_at.pop(appliance_key, None)
+                    return None, None, None
+                self._checked_at[appliance_key] = (time.monotonic(), entry[0])
+                return entry[1:]
+            with self._lock:
+                if appliance_key in self._entries:
+                    self.reloads += 1
+                self.loads += 1
+                self.load_seconds[appliance_key] = duration
+                self._entries[appliance_key] = (signature, model, scaler, metadata)
+                self._entries.move_to_end(appliance_key)
+                while len(self._entries) > self.max_resident:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            logger.info("Loaded %s %s model for '%s' in %.3fs", self.backend, metadata['kind'], appliance_key, duration)
+            return model, scaler, metadata
+
+    def _load(self, appliance_key):
+        model_path, scaler_path = self.paths(appliance_key)
+        metadata = load_metadata(self.model_dir, appliance_key)
+        with open(scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        if self.backend == 'numpy':
+            from numpy_inference import NumpyForecaster, NumpyScaler
+            model, scaler = NumpyForecaster.from_h5(model_path), NumpyScaler.from_sklearn(scaler)
+            outputs = model.output_size
+        else:
+            from tensorflow.keras.models import load_model
+            model = load_model(model_path)
+            outputs = model.output_shape[-1]
+        # e.g. a one-step model paired with metadata declaring a direct one
+        expected = metadata['horizon'] if metadata['kind'] == DIRECT else 1
+        if outputs != expected:
+            raise ValueError(f"{metadata['kind']} model for '{appliance_key}' has {outputs} outputs, expected {expected}")
+        return model, scaler, metadata
+
+    def preload(self, appliance_keys=None):
+        """Loads models up front, e.g. in a server process before it forks workers."""
+        for appliance_key in (appliance_keys or self.available_keys())[:self.max_resident]:
+            self.get(appliance_key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'resident': len(self._entries),
+                'max_resident': self.max_resident,
+                'loads': self.loads,
+                'reloads': self.reloads,
+                'evictions': self.evictions,
+                'load_seconds': dict(self.load_seconds),
+            }
@@ -1,11 +1,13 @@
 from app import db
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import date # Import date
+from datetime import date, datetime # Import date
 
 # Association Table for Many-to-Many Relationship
 user_appliances = db.Table('user_appliances',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('appliance_id', db.Integer, db.ForeignKey('appliance.id'), primary_key=True)
+    db.Column('appliance_id', db.Integer, db.ForeignKey('appliance.id'), primary_key=True),
+    # The primary key covers lookups by user; this covers lookups by appliance
+    db.Index('ix_user_appliances_appliance_id', 'appliance_id')
 )
 
 class Appliance(db.Model):
@@ -13,9 +15,9 @@ class Appliance(db.Model):
     Represents a high-end home appliance in our KBIS database.
     """
     id = db.Column(db.Integer, primary_key=True)
-    brand = db.Column(db.String(80), nullable=False)
+    brand = db.Column(db.String(80), nullable=False, index=True)
     model = db.Column(db.String(120), nullable=False, unique=True)
-    appliance_type = db.Column(db.String(80), nullable=False)
+    appliance_type = db.Column(db.String(80), nullable=False, index=True)
     avg_power_consumption_kwh = db.Column(db.Float, nullable=False)
     avg_water_consumption_liters = db.Column(db.Float, nullable=True)
     has_delay_start = db.Column(db.Boolean, default=False)
@@ -24,6 +26,16 @@ class Appliance(db.Model):
     def __repr__(self):
         return f'<Appliance {self.brand} {self.model}>'
 
+class CatalogState(db.Model):
+    """
+    A single row versioning the appliance catalog. It is bumped in the same
+    transaction as every change to the appliance table, so each server process
+    can tell whether its cached catalog responses are still current.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 class User(db.Model):
     """
     Represents a user of the EcoWise Advisor app.
@@ -38,7 +50,8 @@ class User(db.Model):
     current_streak = db.Column(db.Integer, default=0)
     last_suggestion_date = db.Column(db.Date, nullable=True)
     
-    appliances = db.relationship('Appliance', secondary=user_appliances, lazy='subquery',
+    # Loaded only when accessed; endpoints use the queries in repository.py instead
+    appliances = db.relationship('Appliance', secondary=user_appliances, lazy='select',
         backref=db.backref('users', lazy=True))
 
     def set_password(self, password):
@@ -50,3 +63,57 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class SavingsEntry(db.Model):
+    """
+    One accepted suggestion. The ledger is append-only; User.total_savings and
+    User.current_streak are running totals updated alongside each entry.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    savings = db.Column(db.Float, nullable=False)
+    accepted_on = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_savings_entry_user_accepted', 'user_id', 'accepted_on'),)
+
+    def __repr__(self):
+        return f'<SavingsEntry user={self.user_id} {self.savings}>'
+
+class Reading(db.Model):
+    """
+    One metered power reading in the dataset's schema, as pushed to the
+    ingestion API: a queryable copy of the readings ingestion appended to the
+    consumption dataset, which is what duplicates and ordering are checked
+    against (see ingest_readings.py).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    appliance_type = db.Column(db.String(80), nullable=False)
+    datetime = db.Column(db.DateTime, nullable=False)
+    temperature = db.Column(db.Float, nullable=True)
+    humidity = db.Column(db.Float, nullable=True)
+    wind_speed = db.Column(db.Float, nullable=True)
+    general_diffuse_flows = db.Column(db.Float, nullable=True)
+    diffuse_flows = db.Column(db.Float, nullable=True)
+    power_consumption = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('appliance_type', 'datetime', name='uq_reading_appliance_datetime'),)
+
+    def __repr__(self):
+        return f'<Reading {self.appliance_type} {self.datetime}>'
+
+class Forecast(db.Model):
+    """
+    A precomputed 24-hour forecast for one appliance type, written by
+    precompute_forecasts.py so the web tier can skip model inference.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    appliance_type = db.Column(db.String(80), nullable=False)
+    generated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Identifies the model files and readings the forecast was computed from
+    model_version = db.Column(db.String(200), nullable=False)
+    values = db.Column(db.JSON, nullable=False)
+
+    __table_args__ = (db.Index('ix_forecast_type_generated', 'appliance_type', 'generated_at'),)
+
+    def __repr__(self):
+        return f'<Forecast {self.appliance_type} {self.generated_at}>'
@@ -0,0 +1,266 @@
+import json
+
+import numpy as np
+
+# Activation functions used by the saved Keras models
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'hard_sigmoid': lambda x: np.clip(0.2 * x + 0.5, 0.0, 1.0),
+}
+
+
+class NumpyScaler:
+    """
+    The parameters of a fitted MinMaxScaler, applied with plain NumPy.
+    Avoids scikit-learn's per-call input validation on the hot path.
+    """
+
+    def __init__(self, min_, scale_):
+        self.min_ = np.asarray(min_, dtype=np.float32)
+        self.scale_ = np.asarray(scale_, dtype=np.float32)
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        return cls(scaler.min_, scaler.scale_)
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float32) * self.scale_ + self.min_
+
+    def inverse_transform(self, X):
+        return (np.asarray(X, dtype=np.float32) - self.min_) / self.scale_
+
+
+class NumpyForecaster:
+    """
+    A Sequential LSTM + Dense model loaded straight from a Keras .h5 file and
+    evaluated with NumPy, so serving does not need TensorFlow.
+
+    Only the layers our training script produces are supported: a single LSTM
+    (return_sequences=False) followed by one or more Dense layers.
+    """
+
+    def __init__(self, layers, look_back):
+        self.layers = layers
+        self.look_back = look_back
+        self.output_size = layers[-1]['kernel'].shape[1]
+
+    @classmethod
+    def from_h5(cls, path):
+        import h5py
+        with h5py.File(path, 'r') as f:
+            config = json.loads(_as_str(f.attrs['model_config']))
+            weights = f['model_weights'] if 'model_weights' in f else f
+            layers = []
+            look_back = None
+            for layer in config['config']['layers']:
+                kind, layer_config = layer['class_name'], layer['config']
+                if kind == 'InputLayer':
+                    look_back = (layer_config.get('batch_shape') or layer_config.get('batch_input_shape'))[1]
+                    continue
+                if look_back is None and 'batch_input_shape' in layer_config:
+                    look_back = layer_config['batch_input_shape'][1]
+                params = _layer_weights(weights[layer_config['name']])
+                if kind == 'LSTM':
+                    if layer_config.get('return_sequences'):
+                        raise ValueError("LSTM layers returning sequences are not supported")
+                    layers.append({
+                        'type': 'lstm',
+                        'kernel': params['kernel'],
+                        'recurrent_kernel': params['recurrent_kernel'],
+                        'bias': params.get('bias', np.zeros(params['kernel'].shape[1], dtype=np.float32)),
+                        'activation': ACTIVATIONS[layer_config.get('activation', 'tanh')],
+                        'recurrent_activation': ACTIVATIONS[layer_config.get('recurrent_activation', 'sigmoid')],
+                    })
+                elif kind == 'Dense':
+                    layers.append({
+                        'type': 'dense',
+                        'kernel': params['kernel'],
+                        'bias': params.get('bias', np.zeros(params['kernel'].shape[1], dtype=np.float32)),
+                        'activation': ACTIVATIONS[layer_config.get('activation', 'linear')],
+                    })
+                else:
+                    raise ValueError(f"Unsupported layer type: {kind}")
+        return cls(layers, look_back)
+
+    def predict(self, X):
+        """Forward pass for a batch of scaled windows shaped (batch, look_back, 1)."""
+        x = np.asarray(X, dtype=np.float32)
+        for layer in self.layers:
+            if layer['type'] == 'lstm':
+                x = _lstm_forward(x, layer)
+            else:
+                x = layer['activation'](x @ layer['kernel'] + layer['bias'])
+        return x
+
+    def forecast(self, X):
+        """
+        Direct forecast: a model with one output per horizon step predicts the
+        whole horizon in a single forward pass, shaped (batch, output_size).
+        """
+        return predict_many([self], X)
+
+    def rollout(self, X, steps):
+        """
+        Autoregressive forecast: predicts one step, appends it to the window and
+        repeats. Returns an array shaped (batch, steps) of scaled predictions.
+        """
+        return rollout_many([self], X, steps)
+
+    def signature(self):
+        """Forecasters with equal signatures can be evaluated as one stacked batch."""
+        return tuple(
+            (layer['type'], layer['kernel'].shape, layer['activation'], layer.get('recurrent_activation'))
+            for layer in self.layers
+        )
+
+
+def rollout_many(forecasters, X, steps):
+    """
+    Runs the autoregressive rollout for several windows at once. `forecasters`
+    holds either one model shared by every row of `X` or one model per row;
+    rows whose models have the same architecture are stacked and evaluated
+    together, so k appliance types cost one batched pass instead of k.
+    """
+    batch = np.array(X, dtype=np.float32).reshape(len(X), -1)
+    if len(forecasters) == 1:
+        return _rollout_stacked(_stack_weights(forecasters), batch, steps)
+    result = np.empty((len(batch), steps), dtype=np.float32)
+    groups = {}
+    for row, forecaster in enumerate(forecasters):
+        groups.setdefault(forecaster.signature(), []).append(row)
+    for rows in groups.values():
+        result[rows] = _rollout_stacked(_stack_weights([forecasters[r] for r in rows]), batch[rows], steps)
+    return result
+
+
+def predict_many(forecasters, X):
+    """
+    One forward pass for several windows at once, grouped and stacked like
+    rollout_many. Used for direct models, whose output is the whole horizon;
+    when their horizons differ, every row is cut to the shortest one.
+    """
+    batch = np.array(X, dtype=np.float32).reshape(len(X), -1)
+    if len(forecasters) == 1:
+        return _predict_stacked(_stack_weights(forecasters), batch)
+    horizon = min(f.output_size for f in forecasters)
+    result = np.empty((len(batch), horizon), dtype=np.float32)
+    groups = {}
+    for row, forecaster in enumerate(forecasters):
+        groups.setdefault(forecaster.signature(), []).append(row)
+    for rows in groups.values():
+        result[rows] = _predict_stacked(_stack_weights([forecasters[r] for r in rows]), batch[rows])[:, :horizon]
+    return result
+
+
+def _stack_weights(forecasters):
+    # Weights gain a leading axis: size 1 (broadcast to every row) or one per row
+    def stack(index, name):
+        return np.stack([f.layers[index][name] for f in forecasters])
+    first = forecasters[0].layers
+    if first[0]['type'] != 'lstm' or any(layer['type'] != 'dense' for layer in first[1:]):
+        raise ValueError("Rollout needs an LSTM followed by Dense layers")
+    return {
+        'kernel': stack(0, 'kernel')[:, 0],
+        'recurrent_kernel': stack(0, 'recurrent_kernel'),
+        'bias': stack(0, 'bias'),
+        'activation': first[0]['activation'],
+        'recurrent_activation': first[0]['recurrent_activation'],
+        'head': [(stack(i, 'kernel'), stack(i, 'bias'), first[i]['activation']) for i in range(1, len(first))],
+    }
+
+
+def _rollout_stacked(weights, batch, steps):
+    """
+    Step k of the naive rollout re-runs the LSTM over the window starting at
+    position k. Those windows overlap in time, and at any position every window
+    that covers it reads the same input value, so all of them are advanced
+    together: window + steps - 1 batched LSTM steps instead of window * steps
+    single ones, with identical results.
+    """
+    kernel, recurrent_kernel, bias = weights['kernel'], weights['recurrent_kernel'], weights['bias']
+    activation, recurrent_activation = weights['activation'], weights['recurrent_activation']
+    size, window = batch.shape
+    units = recurrent_kernel.shape[1]
+    # The input window followed by every prediction, indexed by time position
+    series = np.empty((size, window + steps), dtype=np.float32)
+    series[:, :window] = batch
+    # LSTM state per (row, window)
+    h = np.zeros((size, steps, units), dtype=np.float32)
+    c = np.zeros((size, steps, units), dtype=np.float32)
+    for t in range(window + steps - 1):
+        # Windows k in [first, last) cover time position t
+        first, last = max(0, t - window + 1), min(t, steps - 1) + 1
+        h_t, c_t = h[:, first:last], c[:, first:last]
+        z = h_t @ recurrent_kernel
+        z += (series[:, t, np.newaxis] * kernel + bias)[:, np.newaxis]
+        gates = recurrent_activation(z)
+        # Keras gate order: input, forget, cell, output
+        c_t *= gates[..., units:2 * units]
+        c_t += gates[..., :units] * activation(z[..., 2 * units:3 * units])
+        h_t[...] = gates[..., 3 * units:] * activation(c_t)
+        if t >= window - 1:
+            # Window `first` has consumed all of its inputs; its output is the
+            # next value of the series.
+            out = h[:, first]
+            for head_kernel, head_bias, head_activation in weights['head']:
+                out = head_activation((out[:, np.newaxis] @ head_kernel)[:, 0] + head_bias)
+            series[:, t + 1] = out[:, 0]
+    return series[:, window:]
+
+
+def _predict_stacked(weights, batch):
+    kernel, recurrent_kernel, bias = weights['kernel'], weights['recurrent_kernel'], weights['bias']
+    activation, recurrent_activation = weights['activation'], weights['recurrent_activation']
+    size, window = batch.shape
+    units = recurrent_kernel.shape[1]
+    h = np.zeros((size, units), dtype=np.float32)
+    c = np.zeros((size, units), dtype=np.float32)
+    for t in range(window):
+        z = (h[:, np.newaxis] @ recurrent_kernel)[:, 0]
+        z += batch[:, t, np.newaxis] * kernel + bias
+        # Keras gate order: input, forget, cell, output
+        gates = recurrent_activation(z)
+        c = gates[:, units:2 * units] * c + gates[:, :units] * activation(z[:, 2 * units:3 * units])
+        h = gates[:, 3 * units:] * activation(c)
+    out = h
+    for head_kernel, head_bias, head_activation in weights['head']:
+        out = head_activation((out[:, np.newaxis] @ head_kernel)[:, 0] + head_bias)
+    return out
+
+
+def _lstm_forward(x, layer):
+    kernel, recurrent_kernel = layer['kernel'], layer['recurrent_kernel']
+    activation, recurrent_activation = layer['activation'], layer['recurrent_activation']
+    units = recurrent_kernel.shape[0]
+    # The input projection does not depend on the state, so do it for all steps at once
+    projected = x @ kernel + layer['bias']
+    h = np.zeros((x.shape[0], units), dtype=np.float32)
+    c = np.zeros((x.shape[0], units), dtype=np.float32)
+    for t in range(x.shape[1]):
+        z = projected[:, t] + h @ recurrent_kernel
+        # Keras gate order: input, forget, cell, output
+        gates = recurrent_activation(z)
+        i, f, o = gates[:, :units], gates[:, units:2 * units], gates[:, 3 * units:]
+        g = activation(z[:, 2 * units:3 * units])
+        c = f * c + i * g
+        h = o * activation(c)
+    return h
+
+
+def _layer_weights(group):
+    # Weight datasets are nested under the layer's group; Keras 2 names them
+    # e.g. 'kernel:0', Keras 3 just 'kernel'.
+    params = {}
+    def visit(name, obj):
+        if hasattr(obj, 'shape'):
+            params[name.rsplit('/', 1)[-1].split(':')[0]] = np.asarray(obj, dtype=np.float32)
+    group.visititems(visit)
+    return params
+
+
+def _as_str(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
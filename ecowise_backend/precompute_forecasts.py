@@ -0,0 +1,77 @@
+from app import app, db, model_registry, timeseries_store, compute_appliance_forecasts, get_model_version
+from models import Forecast
+from repository import ensure_indexes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import logging
+import time
+
+# Computes the 24-hour forecast for every appliance type with a saved model and
+# stores it in the forecast table. The web tier serves these until they are
+# older than FORECAST_MAX_AGE, or until the models or readings change.
+#
+#   python precompute_forecasts.py                  # run once
+#   python precompute_forecasts.py --interval 900   # keep running every 15 minutes
+
+def appliance_types_with_models():
+    """Maps the saved model keys (e.g. 'ev_charger') back to dataset appliance types."""
+    keys = set(model_registry.available_keys())
+    return [t for t in timeseries_store.appliance_types() if t.lower().replace(' ', '_') in keys]
+
+def precompute(workers=4, keep=5):
+    timeseries_store.refresh()
+    appliance_types = appliance_types_with_models()
+    if not appliance_types:
+        print("No appliance types with saved models found.")
+        return 0
+
+    # Each worker forecasts a slice of the types as one batch
+    chunks = [appliance_types[i::workers] for i in range(min(workers, len(appliance_types)))]
+    started = time.perf_counter()
+    forecasts = {}
+    with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+        for result in pool.map(compute_appliance_forecasts, chunks):
+            forecasts.update(result)
+
+    generated_at = datetime.utcnow()
+    rows = [
+        Forecast(appliance_type=t, generated_at=generated_at, model_version=get_model_version(t), values=values)
+        for t, values in forecasts.items()
+        if values is not None
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    prune(keep)
+
+    failed = sorted(t for t, values in forecasts.items() if values is None)
+    print(f"Stored {len(rows)} forecasts in {time.perf_counter() - started:.2f}s"
+          + (f"; failed: {failed}" if failed else ""))
+    return len(rows)
+
+def prune(keep):
+    """Deletes all but the newest `keep` forecasts per appliance type."""
+    for (appliance_type,) in db.session.query(Forecast.appliance_type).distinct():
+        stale_ids = [row.id for row in Forecast.query.filter_by(appliance_type=appliance_type)
+                     .order_by(Forecast.generated_at.desc()).offset(keep).with_entities(Forecast.id)]
+        if stale_ids:
+            Forecast.query.filter(Forecast.id.in_(stale_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute appliance forecasts into the database.")
+    parser.add_argument('--workers', type=int, default=4, help="appliance type batches computed in parallel")
+    parser.add_argument('--keep', type=int, default=5, help="forecasts kept per appliance type")
+    parser.add_argument('--interval', type=int, default=0, help="repeat every N seconds (0 = run once)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    with app.app_context():
+        # Creates the forecast table on databases set up before it existed
+        db.create_all()
+        ensure_indexes()
+        while True:
+            precompute(args.workers, args.keep)
+            if not args.interval:
+                break
+            time.sleep(args.interval)
@@ -0,0 +1,222 @@
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from itertools import chain
+
+from sqlalchemy import case, delete, event, exists, func, inspect, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import db
+from models import Appliance, CatalogState, SavingsEntry, User, user_appliances
+
+logger = logging.getLogger(__name__)
+
+# Targeted queries for the endpoints, so a request only reads the rows it needs
+# instead of going through User.appliances.
+
+def configure_sqlite(engine, busy_timeout_ms=5000):
+    """
+    Sets per-connection SQLite pragmas: WAL so readers don't block the writer,
+    NORMAL sync (safe under WAL), a busy timeout instead of immediate 'database
+    is locked' errors, and foreign key enforcement.
+    """
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+def ensure_indexes():
+    """Creates indexes declared on the models that are missing from an existing database."""
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def user_has_appliance(user_id, appliance_id):
+    return db.session.scalar(select(exists().where(
+        user_appliances.c.user_id == user_id,
+        user_appliances.c.appliance_id == appliance_id,
+    )))
+
+def get_user_appliances(user_id):
+    """The user's appliances as full Appliance objects, in one query."""
+    return db.session.scalars(
+        select(Appliance)
+        .join(user_appliances, user_appliances.c.appliance_id == Appliance.id)
+        .where(user_appliances.c.user_id == user_id)
+        .order_by(Appliance.id)
+    ).all()
+
+def get_user_appliance_summaries(user_id):
+    """(id, brand, model) rows for the user's appliances."""
+    return db.session.execute(
+        select(Appliance.id, Appliance.brand, Appliance.model)
+        .join(user_appliances, user_appliances.c.appliance_id == Appliance.id)
+        .where(user_appliances.c.user_id == user_id)
+        .order_by(Appliance.id)
+    ).all()
+
+def get_consumption_breakdown(user_id):
+    """(appliance_type, avg_power_consumption_kwh) rows for the user's appliances."""
+    return db.session.execute(
+        select(Appliance.appliance_type, Appliance.avg_power_consumption_kwh)
+        .join(user_appliances, user_appliances.c.appliance_id == Appliance.id)
+        .where(user_appliances.c.user_id == user_id)
+        .order_by(Appliance.id)
+    ).all()
+
+def add_user_appliance(user_id, appliance_id):
+    """Links an appliance to a user. Returns False if it was already linked."""
+    # One statement, so two concurrent adds can't both pass a check and then collide
+    result = db.session.execute(
+        sqlite_insert(user_appliances).values(user_id=user_id, appliance_id=appliance_id).on_conflict_do_nothing()
+    )
+    db.session.commit()
+    return result.rowcount > 0
+
+def remove_user_appliance(user_id, appliance_id):
+    """Unlinks an appliance from a user. Returns False if it was not linked."""
+    result = db.session.execute(delete(user_appliances).where(
+        user_appliances.c.user_id == user_id,
+        user_appliances.c.appliance_id == appliance_id,
+    ))
+    db.session.commit()
+    return result.rowcount > 0
+
+# --- Fleet-wide jobs ---
+
+def get_owned_appliance_types():
+    """Distinct types of the appliances at least one user owns."""
+    return db.session.scalars(
+        select(Appliance.appliance_type).distinct()
+        .join(user_appliances, user_appliances.c.appliance_id == Appliance.id)
+        .order_by(Appliance.appliance_type)
+    ).all()
+
+def iter_user_appliance_pages(page_size=1000, after_id=0):
+    """
+    Yields pages of users in id order, starting after user `after_id`, as
+    lists of (user_id, username, [(appliance_id, brand, model, appliance_type,
+    avg_power_consumption_kwh), ...]). Each page costs two keyset queries and
+    only plain tuples are kept, so memory stays flat however many users there are.
+    """
+    while True:
+        users = db.session.execute(
+            select(User.id, User.username).where(User.id > after_id).order_by(User.id).limit(page_size)
+        ).all()
+        if not users:
+            return
+        owned = {}
+        for user_id, *appliance in db.session.execute(
+            select(user_appliances.c.user_id, Appliance.id, Appliance.brand, Appliance.model,
+                   Appliance.appliance_type, Appliance.avg_power_consumption_kwh)
+            .join(Appliance, Appliance.id == user_appliances.c.appliance_id)
+            .where(user_appliances.c.user_id.between(users[0].id, users[-1].id))
+            .order_by(user_appliances.c.user_id, Appliance.id)
+        ):
+            owned.setdefault(user_id, []).append(tuple(appliance))
+        # Read-only; don't keep a transaction open across pages
+        db.session.rollback()
+        yield [(user_id, username, owned.get(user_id, [])) for user_id, username in users]
+        after_id = users[-1].id
+
+# --- Savings ledger ---
+
+def record_accepts(accepts):
+    """
+    Applies (user_id, savings, accepted_on) accepts in order, in one
+    transaction. Each accept updates the user's streak and total with a single
+    UPDATE ... RETURNING, so concurrent accepts never overwrite each other, and
+    is appended to the savings ledger. Returns (new_streak, new_total_savings)
+    per accept, or None where the user does not exist.
+    """
+    results = []
+    entries = []
+    now = datetime.utcnow()
+    try:
+        for user_id, savings, accepted_on in accepts:
+            streak = case(
+                (User.last_suggestion_date == accepted_on - timedelta(days=1), func.coalesce(User.current_streak, 0) + 1),
+                (User.last_suggestion_date == accepted_on, func.coalesce(User.current_streak, 0)),
+                else_=1,
+            )
+            row = db.session.execute(
+                update(User).where(User.id == user_id)
+                .values(current_streak=streak, last_suggestion_date=accepted_on,
+                        total_savings=func.coalesce(User.total_savings, 0.0) + savings)
+                .returning(User.current_streak, User.total_savings)
+                .execution_options(synchronize_session=False)
+            ).first()
+            results.append(tuple(row) if row else None)
+            if row:
+                entries.append({'user_id': user_id, 'savings': savings, 'accepted_on': accepted_on, 'created_at': now})
+        if entries:
+            db.session.execute(insert(SavingsEntry), entries)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return results
+
+# --- Appliance catalog ---
+
+def list_appliances(appliance_type=None, brand=None, eco_mode=None, delay_start=None, after_id=None, limit=None):
+    """
+    Catalog rows matching the filters, ordered by id. `after_id` and `limit`
+    page through them by key, so a page costs the same wherever it starts.
+    """
+    query = select(Appliance.id, Appliance.brand, Appliance.model, Appliance.appliance_type).order_by(Appliance.id)
+    if appliance_type is not None:
+        query = query.where(Appliance.appliance_type == appliance_type)
+    if brand is not None:
+        query = query.where(Appliance.brand == brand)
+    if eco_mode is not None:
+        query = query.where(Appliance.has_eco_mode == eco_mode)
+    if delay_start is not None:
+        query = query.where(Appliance.has_delay_start == delay_start)
+    if after_id is not None:
+        query = query.where(Appliance.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return db.session.execute(query).all()
+
+def get_catalog_state():
+    """(version, updated_at) of the appliance catalog; (0, None) before the first change."""
+    try:
+        row = db.session.execute(select(CatalogState.version, CatalogState.updated_at).where(CatalogState.id == 1)).first()
+    except SQLAlchemyError as e:
+        # A database created before the catalog_state table existed
+        db.session.rollback()
+        logger.warning("Could not read the catalog version: %s", e)
+        return 0, None
+    return (row.version, row.updated_at) if row else (0, None)
+
+def bump_catalog_version(connection):
+    now = datetime.utcnow()
+    result = connection.execute(
+        update(CatalogState).where(CatalogState.id == 1).values(version=CatalogState.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(CatalogState).values(id=1, version=1, updated_at=now))
+
+@event.listens_for(Session, 'after_flush')
+def _bump_catalog_on_change(session, flush_context):
+    # Linking an appliance to a user also marks it dirty through the backref,
+    # so only column changes count as catalog changes.
+    changed = any(
+        isinstance(obj, Appliance) and (obj not in session.dirty or session.is_modified(obj, include_collections=False))
+        for obj in chain(session.new, session.dirty, session.deleted)
+    )
+    if changed:
+        bump_catalog_version(session.connection())
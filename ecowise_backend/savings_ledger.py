@@ -0,0 +1,47 @@
+from micro_batcher import MicroBatcher
+
+
+class SavingsLedgerWriter(MicroBatcher):
+    """
+    Writes accepted suggestions to the database from a single writer thread.
+
+    Callers `submit()` a (user_id, savings, accepted_on) accept and get a
+    Future back. Each batch the writer collects (see MicroBatcher) is passed,
+    in order, to `write_batch`, which applies it in one transaction and returns
+    one result per accept. Many accepts thus share one SQLite write lock and
+    one commit instead of each request opening its own write transaction.
+
+    An accept whose Future is cancelled before its batch starts is never
+    written, so a caller that gives up waiting can cancel it and safely retry.
+    """
+
+    thread_name = 'savings-ledger-writer'
+
+    def __init__(self, write_batch, batch_window_ms=5.0, max_batch=256):
+        super().__init__(batch_window_ms, max_batch)
+        self.write_batch = write_batch
+        self.accepts = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    def _process(self, batch):
+        self.accepts += len(batch)
+        self.batches += 1
+        try:
+            results = self.write_batch([accept for accept, _ in batch])
+        except Exception as e:
+            self.failed_batches += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            'accepts': self.accepts,
+            'batches': self.batches,
+            'failed_batches': self.failed_batches,
+            'queued': self.queued(),
+            'avg_batch_size': round(self.accepts / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,232 @@
+import argparse
+import os
+import sys
+
+# Thread caps have to be in the environment before NumPy, BLAS or TensorFlow
+# start their thread pools, so they are set before anything else is imported.
+def _threads_arg(argv):
+    for i, arg in enumerate(argv):
+        if arg.startswith('--threads-per-worker='):
+            return arg.split('=', 1)[1]
+        if arg == '--threads-per-worker' and i + 1 < len(argv):
+            return argv[i + 1]
+    return '1'
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+for _var in THREAD_ENV_VARS:
+    os.environ.setdefault(_var, _threads_arg(sys.argv[1:]))
+
+import gc
+import logging
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from app import create_app, db, model_registry, timeseries_store, use_numpy_backend
+
+# Production entry point. The master process loads the consumption data (and,
+# with the NumPy backend, every model and scaler) once, then forks worker
+# processes that serve requests from a shared listening socket. Workers inherit
+# the loaded data copy-on-write instead of each loading their own.
+#
+#   python serve.py --workers 4 --port 5000
+#
+# SIGHUP refreshes the data in the master and replaces the workers one at a
+# time; SIGTERM / SIGINT stop them gracefully.
+
+class Master:
+
+    def __init__(self, app, host, port, workers, threads_per_worker, graceful_timeout):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.graceful_timeout = graceful_timeout
+        self.workers = set()  # pids
+        self.stopping = False
+        self.reload_requested = False
+        self.sock = None
+
+    def preload(self):
+        started = time.perf_counter()
+        timeseries_store.refresh()
+        # TensorFlow's runtime threads do not survive fork(), so Keras models
+        # are loaded lazily by each worker instead.
+        if use_numpy_backend:
+            model_registry.preload()
+        # Connections must not be shared with the forked workers
+        with self.app.app_context():
+            db.engine.dispose()
+        # Keep the loaded objects out of the collector's generations, so a
+        # worker's first collection doesn't touch (and copy) their pages.
+        gc.collect()
+        gc.freeze()
+        print(f"Master {os.getpid()} preloaded data in {time.perf_counter() - started:.2f}s "
+              f"({model_registry.stats()['resident']} models resident)")
+
+    def run(self):
+        self.sock = socket.create_server((self.host, self.port), backlog=128)
+        self.sock.set_inheritable(True)
+        self.preload()
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        print(f"Serving on http://{self.host}:{self.port} with {self.num_workers} workers")
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            # Signals don't interrupt a blocking waitpid(), so poll instead
+            if self.reap() is None:
+                time.sleep(0.2)
+            # Replace workers that exited unexpectedly
+            while not self.stopping and len(self.workers) < self.num_workers:
+                self.spawn_worker()
+        self.shutdown()
+
+    def spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            code = 0
+            try:
+                Worker(self.app, self.host, self.port, self.sock, self.threads_per_worker).run()
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers.add(pid)
+        return pid
+
+    def reap(self):
+        """Collects one exited worker, if any, and returns its pid."""
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return None
+        if pid:
+            self.workers.discard(pid)
+            if not self.stopping and status != 0:
+                print(f"Worker {pid} exited with status {status}")
+        return pid or None
+
+    def rolling_restart(self):
+        print("Reloading: refreshing data and replacing workers one at a time")
+        gc.unfreeze()
+        self.preload()
+        for old in list(self.workers):
+            if self.stopping:
+                return
+            self.spawn_worker()
+            self.stop_worker(old)
+
+    def stop_worker(self, pid):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.workers.discard(pid)
+            return
+        deadline = time.monotonic() + self.graceful_timeout
+        while pid in self.workers and time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self.workers.discard(pid)
+                return
+            time.sleep(0.05)
+        if pid in self.workers:
+            print(f"Worker {pid} did not stop within {self.graceful_timeout}s; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.workers.discard(pid)
+
+    def shutdown(self):
+        print("Stopping workers...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.discard(pid)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            if self.reap() is None:
+                time.sleep(0.05)
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.sock.close()
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+
+class Worker:
+
+    def __init__(self, app, host, port, sock, threads):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.threads = threads
+        self.server = None
+
+    def run(self):
+        # The pool copied from the master refers to its connections; drop it
+        # without closing them so this process opens its own.
+        with self.app.app_context():
+            db.engine.dispose(close=False)
+        # NumPy's BLAS pool may have been sized in the master before the
+        # environment caps applied, so limit it directly as well.
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(self.threads)
+
+        self.server = make_server(self.host, self.port, self.app, threaded=True, fd=self.sock.fileno())
+        # Let in-flight requests finish when the worker is stopped
+        self.server.daemon_threads = False
+        self.server.block_on_close = True
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        print(f"Worker {os.getpid()} started")
+        self.server.serve_forever()
+        self.server.server_close()
+
+    def _handle_stop(self, signum, frame):
+        # shutdown() waits for serve_forever() to return, so it can't run on the
+        # thread that is inside serve_forever()
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the EcoWise backend with pre-forked worker processes.")
+    parser.add_argument('--host', default=os.environ.get('ECOWISE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('ECOWISE_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ECOWISE_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="CPU threads each worker's BLAS/TensorFlow may use")
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help="seconds a stopping worker gets to finish in-flight requests")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s')
+    if not hasattr(os, 'fork'):
+        sys.exit("serve.py needs os.fork(); use `python app.py` on this platform.")
+    Master(create_app(), args.host, args.port, args.workers, args.threads_per_worker, args.graceful_timeout).run()
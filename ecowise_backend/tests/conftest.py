@@ -0,0 +1,66 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# The backend modules import each other as top-level modules (e.g. `from app import db`)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+# app.py reads its configuration at import time: use an in-memory database, a
+# scratch copy of the dataset (POST /readings appends to it), and run the
+# inference and savings workers inline so every query happens in the request.
+_scratch = tempfile.mkdtemp(prefix='ecowise-tests-')
+shutil.copy(os.path.join(BACKEND_DIR, 'data', 'power_consumption.csv'), _scratch)
+os.environ.setdefault('ECOWISE_DATABASE_URI', 'sqlite://')
+os.environ.setdefault('ECOWISE_DATASET_PATH', os.path.join(_scratch, 'power_consumption.csv'))
+os.environ.setdefault('ECOWISE_INFERENCE_SERVICE_ENABLED', '0')
+os.environ.setdefault('ECOWISE_SAVINGS_WRITER_ENABLED', '0')
+os.environ.setdefault('ECOWISE_INGEST_TOKEN', 'test-token')
+
+
+@pytest.fixture
+def app():
+    pytest.importorskip('flask_sqlalchemy')
+    import app as backend
+    # Set up in a context of its own: requests must not share a session (and
+    # its identity map) with the test, or they would skip queries they make.
+    with backend.app.app_context():
+        backend.db.drop_all()
+        backend.db.create_all()
+    backend.forecast_cache.invalidate()
+    backend.catalog_cache.invalidate()
+    return backend
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def household(app, client, monkeypatch):
+    """A logged-in user owning `count` appliances; returns (user_id, appliance_ids)."""
+    from models import Appliance, User, user_appliances
+    monkeypatch.setattr(app, 'infer_forecasts', lambda types: {t: [1000.0 + i for i in range(24)] for t in types})
+
+    def make(count):
+        with app.app.app_context():
+            user = User(username=f'user{count}', location='Chennai')
+            user.set_password('secret')
+            appliances = [
+                Appliance(brand='Brand', model=f'Model {count}-{i}', appliance_type=t, avg_power_consumption_kwh=1.0 + i)
+                for i, t in enumerate(['Dishwasher', 'Oven', 'TV', 'EV Charger', 'Washing Machine'] * (count // 5 + 1))
+            ][:count]
+            app.db.session.add(user)
+            app.db.session.add_all(appliances)
+            app.db.session.commit()
+            app.db.session.execute(user_appliances.insert(), [{'user_id': user.id, 'appliance_id': a.id} for a in appliances])
+            app.db.session.commit()
+            user_id, appliance_ids = user.id, [a.id for a in appliances]
+            username = user.username
+        client.post('/login', json={'username': username, 'password': 'secret'})
+        return user_id, appliance_ids
+    return make
@@ -0,0 +1,143 @@
+import itertools
+import json
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import advisor_logic
+from advisor_logic import (APPLIANCE_CYCLE_LENGTHS, find_best_windows, load_tariff_plans, schedule_household,
+                           score_appliances, window_sums)
+
+Appliance = namedtuple('Appliance', 'id brand model appliance_type avg_power_consumption_kwh')
+NOW = datetime(2024, 1, 1, 23, 0)  # the schedule's first hour is hour 0 of the day
+
+
+def appliance(appliance_type, kwh, id=0):
+    return Appliance(id, 'Brand', 'Model', appliance_type, kwh)
+
+
+def brute_force(appliances, rates, peak_kw):
+    """Cheapest total cost over every combination of start hours that stays under the cap."""
+    horizon = len(rates)
+    lengths = [APPLIANCE_CYCLE_LENGTHS[a.appliance_type] for a in appliances]
+    powers = [a.avg_power_consumption_kwh / n for a, n in zip(appliances, lengths)]
+    best = np.inf
+    for starts in itertools.product(*(range(horizon - n + 1) for n in lengths)):
+        load = np.zeros(horizon)
+        for start, n, power in zip(starts, lengths, powers):
+            load[start:start + n] += power
+        if load.max() <= peak_kw + 1e-9:
+            best = min(best, sum(power * rates[start:start + n].sum() for start, n, power in zip(starts, lengths, powers)))
+    return best
+
+
+@pytest.fixture
+def random_tariff(monkeypatch):
+    def make(seed):
+        rates = np.random.default_rng(seed).choice([4.0, 6.0, 9.0, 12.0], size=24)
+        monkeypatch.setitem(advisor_logic.TARIFF_PLANS, 'test', rates)
+        return rates
+    return make
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_branch_and_bound_matches_brute_force(random_tariff, seed):
+    rates = random_tariff(seed)[:8]
+    appliances = [appliance('Dishwasher', 3.0, 1), appliance('Oven', 2.5, 2),
+                  appliance('Washing Machine', 2.0, 3), appliance('TV', 2.0, 4)]
+    result = schedule_household(appliances, {}, peak_kw=3.0, tariff='test', horizon=8, now=NOW)
+    assert result['status'] == 'optimal'
+    assert result['total_cost'] == pytest.approx(brute_force(appliances, rates, 3.0))
+    assert result['max_load_kw'] <= 3.0 + 1e-9
+
+
+def test_appliance_over_the_cap_makes_the_schedule_partial(random_tariff):
+    random_tariff(0)
+    appliances = [appliance('Oven', 9.0, 1), appliance('Dishwasher', 2.0, 2)]
+    result = schedule_household(appliances, {}, peak_kw=5.0, tariff='test', horizon=8, now=NOW)
+    assert result['status'] == 'partial'
+    assert result['schedule'][0] is None
+    assert result['schedule'][1] is not None
+
+
+def test_time_budget_keeps_the_greedy_schedule(random_tariff):
+    random_tariff(1)
+    appliances = [appliance('Dishwasher', 3.0, 1), appliance('Oven', 2.5, 2), appliance('Washing Machine', 2.0, 3)]
+    result = schedule_household(appliances, {}, peak_kw=3.0, tariff='test', horizon=8, now=NOW, time_budget_ms=0)
+    assert result['status'] == 'time_limit'
+    assert all(entry is not None for entry in result['schedule'])
+    assert result['max_load_kw'] <= 3.0 + 1e-9
+
+
+def test_uncontested_appliance_starts_when_its_suggestion_says():
+    # Flat tariff: every window costs the same, so the forecast decides
+    forecast = [5.0] * 24
+    forecast[9] = forecast[10] = 1.0
+    dishwasher = appliance('Dishwasher', 2.0)
+    result = schedule_household([dishwasher], {'Dishwasher': forecast}, peak_kw=7.0, tariff='flat', now=NOW)
+    (cycle_length, best_hour_from_now, _, _), = score_appliances([dishwasher], {'Dishwasher': forecast}, 'flat', NOW)
+    assert result['schedule'][0]['start'] == best_hour_from_now - 1 == 9
+
+
+def test_hours_past_the_forecast_lose_ties():
+    result = schedule_household([appliance('Oven', 1.0)], {'Oven': [3.0, 2.0, 1.0]}, tariff='flat', horizon=6, now=NOW)
+    assert result['schedule'][0]['start'] == 2
+
+
+def test_window_sums_per_row_sizes_and_windows_past_the_horizon():
+    values = np.arange(6, dtype=float)
+    sums = window_sums(np.stack([values, values]), np.array([1, 3]))
+    assert sums[0].tolist() == values.tolist()
+    assert sums[1, :4].tolist() == [3.0, 6.0, 9.0, 12.0]
+    assert np.isposinf(sums[1, 4:]).all()
+    assert window_sums(values, 7).tolist() == [np.inf] * 6
+
+
+def test_find_best_windows_follows_the_forecast_profile():
+    # Spread evenly, every 2-hour window costs the same. Weighted by the
+    # forecast, the one whose busy hour falls on a cheap rate wins.
+    rates = np.array([[2.0, 10.0, 2.0, 10.0]])
+    forecasts = [[1.0, 1.0, 9.0, 3.0]]
+    best = find_best_windows(forecasts, [2], [2.0], rates)
+    assert best['start'][0, 0] == 1
+    assert best['cost'][0, 0] == pytest.approx(2.0 * (1 * 10.0 + 9 * 2.0) / 10)
+    assert best['baseline_cost'][0, 0] == pytest.approx(2.0 * (1 * 2.0 + 1 * 10.0) / 2)
+    # A zero forecast spreads the energy evenly, so all windows tie
+    flat = find_best_windows([[0.0] * 4], [2], [2.0], rates)
+    assert flat['cost'][0, 0] == pytest.approx(2.0 * (2.0 + 10.0) / 2)
+    assert flat['start'][0, 0] == 0
+
+
+def test_find_best_windows_zero_kwh_and_cycles_longer_than_the_horizon():
+    rates = np.array([[5.0, 5.0, 1.0]])
+    best = find_best_windows([[1.0] * 3, [1.0] * 3], [2, 4], [0.0, 3.0], rates)
+    assert not np.isnan(best['cost']).any()
+    assert best['cost'][0, 0] == 0.0
+    assert np.isposinf(best['cost'][0, 1])
+    assert best['savings'][0, 0] == 0.0
+
+
+def test_find_best_windows_scores_tariff_batches_like_single_tariffs():
+    rng = np.random.default_rng(7)
+    forecasts = rng.uniform(0.5, 3.0, size=(3, 24))
+    cycle_lengths, energy = [1, 3, 6], [1.0, 2.5, 0.0]
+    rates = rng.choice([4.0, 6.0, 9.0], size=(4, 24))
+    batch = find_best_windows(forecasts, cycle_lengths, energy, rates)
+    for t in range(len(rates)):
+        single = find_best_windows(forecasts, cycle_lengths, energy, rates[t])
+        for key in ('start', 'cost', 'baseline_cost', 'savings'):
+            assert np.array_equal(batch[key][t], single[key][0])
+
+
+def test_load_tariff_plans(tmp_path):
+    path = tmp_path / 'plans.json'
+    path.write_text(json.dumps({'night_saver': {'default': 8.0, 'rates': [[23, 7, 3.0]]}, 'hourly': list(range(24))}))
+    plans = load_tariff_plans(str(path))
+    assert plans['night_saver'][23] == plans['night_saver'][6] == 3.0
+    assert plans['night_saver'][7] == 8.0
+    assert plans['hourly'].tolist() == list(range(24))
+    path.write_text(json.dumps({'short': [1.0, 2.0]}))
+    with pytest.raises(ValueError, match='short'):
+        load_tariff_plans(str(path))
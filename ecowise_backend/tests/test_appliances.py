@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture
+def catalog(app):
+    from models import Appliance
+    with app.app.app_context():
+        appliances = [Appliance(brand='Brand', model=f'Model {i}', appliance_type='Oven', avg_power_consumption_kwh=2.0) for i in range(5)]
+        app.db.session.add_all(appliances)
+        app.db.session.commit()
+        return [a.id for a in appliances]
+
+
+@pytest.mark.parametrize('query', ['limit=abc', 'limit=-1', 'limit=0', 'limit=2.5', 'cursor=abc', 'cursor=-3', 'limit=2&cursor=x'])
+def test_invalid_paging_parameters_are_rejected(client, catalog, query):
+    response = client.get(f'/appliances?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_pages_cover_the_catalog_once(client, catalog):
+    seen, cursor = [], None
+    while True:
+        response = client.get('/appliances?limit=2' + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= 2
+        seen += [a['id'] for a in page]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen == catalog
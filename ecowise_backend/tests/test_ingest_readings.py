@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+TOKEN = {'X-Ingest-Token': 'test-token'}
+APPLIANCE = 'Dishwasher'
+
+
+@pytest.fixture
+def store(app):
+    app.timeseries_store.refresh()
+    return app.timeseries_store
+
+
+def last_reading(store):
+    return pd.Timestamp(store.times(APPLIANCE)[-1]).to_pydatetime()
+
+
+def reading(at, power=1.5):
+    return {'Datetime': at.isoformat(sep=' '), 'Appliance': APPLIANCE, 'PowerConsumption': power}
+
+
+def post(client, readings, headers=TOKEN):
+    return client.post('/readings', json=readings, headers=headers)
+
+
+def test_requires_the_ingest_token(client, household, store):
+    household(1)  # a logged-in session is not enough
+    at = last_reading(store) + timedelta(hours=1)
+    assert post(client, [reading(at)], headers={}).status_code == 401
+    assert post(client, [reading(at)], headers={'X-Ingest-Token': 'wrong'}).status_code == 401
+    assert post(client, [reading(at)], headers={'X-Ingest-Token': 'tökén'}).status_code == 401
+    assert last_reading(store) < at
+
+
+def test_readings_already_in_the_dataset_are_duplicates(client, store):
+    times = store.times(APPLIANCE)
+    resent = [reading(pd.Timestamp(t).to_pydatetime()) for t in times[-3:]]
+    response = post(client, resent)
+    assert response.status_code == 200
+    assert response.get_json()['inserted'] == 0
+    assert response.get_json()['duplicates'] == 3
+    assert len(store.times(APPLIANCE)) == len(times)
+
+
+def test_readings_are_appended_in_time_order(app, client, store):
+    last = last_reading(store)
+    length = len(store.times(APPLIANCE))
+    response = post(client, [reading(last + timedelta(hours=3)), reading(last + timedelta(hours=1))])
+    assert response.get_json()['inserted'] == 2
+    times = store.times(APPLIANCE)
+    assert len(times) == length + 2
+    assert np.all(np.diff(times) > np.timedelta64(0))
+
+    response = post(client, [reading(last + timedelta(hours=2)), reading(last + timedelta(hours=3))])
+    body = response.get_json()
+    assert (body['inserted'], body['duplicates'], body['rejected']) == (0, 1, 1)
+    assert body['errors'][0]['record'] == 1
+    assert len(store.times(APPLIANCE)) == length + 2
+    from models import Reading
+    with app.app.app_context():
+        assert app.db.session.query(Reading).count() == 2
+
+
+def test_failed_table_copy_is_reported_and_filled_in_on_retry(app, client, store, monkeypatch):
+    import ingest_readings
+    from models import Reading
+    from sqlalchemy.exc import OperationalError
+
+    def fail(*args, **kwargs):
+        raise OperationalError('INSERT', {}, Exception("database is locked"))
+
+    at = last_reading(store) + timedelta(hours=1)
+    monkeypatch.setattr(ingest_readings.db.session, 'execute', fail)
+    response = post(client, [reading(at)])
+    monkeypatch.undo()
+    assert response.status_code == 503
+    assert (response.get_json()['inserted'], response.get_json()['not_recorded']) == (1, 1)
+    # The dataset confirmed the reading either way
+    assert last_reading(store) == at
+
+    response = post(client, [reading(at)])
+    assert response.status_code == 200
+    assert (response.get_json()['duplicates'], response.get_json()['not_recorded']) == (1, 0)
+    with app.app.app_context():
+        assert app.db.session.query(Reading).filter_by(appliance_type=APPLIANCE, datetime=at).count() == 1
+
+
+def test_readings_with_an_offset_are_converted_to_the_dataset_zone(client, store):
+    last = last_reading(store)
+    local = (last + timedelta(days=1)).replace(hour=10, minute=0, second=0)
+    utc = local - timedelta(hours=5, minutes=30)
+    response = post(client, [{**reading(local), 'Datetime': local.isoformat() + '+05:30'}])
+    assert response.get_json()['inserted'] == 1
+    assert last_reading(store) == utc
+    # The same instant written in UTC is the same reading
+    response = post(client, [{**reading(utc), 'Datetime': utc.isoformat() + 'Z'}])
+    assert response.get_json()['duplicates'] == 1
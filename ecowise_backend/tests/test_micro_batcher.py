@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+
+from inference_service import InferenceService, InferenceTimeout
+from savings_ledger import SavingsLedgerWriter
+
+
+def wait_until_running(future, timeout=5.0):
+    """Waits for the worker to pick up `future`, failing the test instead of hanging."""
+    deadline = time.monotonic() + timeout
+    while not future.running():
+        if time.monotonic() > deadline:
+            pytest.fail(f"worker did not start the batch within {timeout}s")
+        time.sleep(0.001)
+
+
+def test_concurrent_requests_share_one_computation():
+    release = threading.Event()
+    calls = []
+
+    def compute_many(types):
+        calls.append(sorted(types))
+        release.wait(5)
+        return {t: [float(len(t))] for t in types}
+
+    service = InferenceService(compute_many, batch_window_ms=50.0)
+    first = service.submit('Oven')
+    wait_until_running(first)
+    # Queued behind the running batch, so they land in the next one together
+    futures = [service.submit('TV'), service.submit('TV'), service.submit('Dishwasher')]
+    release.set()
+    assert first.result(5) == [4.0]
+    assert [f.result(5) for f in futures] == [[2.0], [2.0], [10.0]]
+    assert calls == [['Oven'], ['Dishwasher', 'TV']]
+    assert service.stats()['computed_types'] == 3
+
+
+def test_cancelled_accept_is_never_written():
+    release = threading.Event()
+    written = []
+
+    def write_batch(accepts):
+        release.wait(5)
+        written.extend(accepts)
+        return [(1, savings) for _, savings, _ in accepts]
+
+    writer = SavingsLedgerWriter(write_batch, batch_window_ms=1.0)
+    running = writer.submit((1, 1.0, None))
+    wait_until_running(running)
+    queued = writer.submit((1, 2.0, None))
+    assert queued.cancel()
+    release.set()
+    assert running.result(5) == (1, 1.0)
+    follow_up = writer.submit((1, 3.0, None))
+    assert follow_up.result(5) == (1, 3.0)
+    assert [savings for _, savings, _ in written] == [1.0, 3.0]
+
+
+def test_accept_times_out_with_503_and_is_not_counted(app, client, household, monkeypatch):
+    user_id, _ = household(1)
+    release = threading.Event()
+    writer = SavingsLedgerWriter(lambda accepts: release.wait(5) and app.write_accepts(accepts), batch_window_ms=1.0)
+    monkeypatch.setattr(app, 'savings_writer', writer)
+    monkeypatch.setitem(app.app.config, 'SAVINGS_WRITE_TIMEOUT', 0.05)
+
+    # Occupies the writer so the request's accept stays queued
+    blocker = writer.submit((user_id, 1.0, app.date.today()))
+    wait_until_running(blocker)
+    response = client.post('/suggestion/accept', json={'savings': 2.5})
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+    release.set()
+    blocker.result(5)
+    response = client.post('/suggestion/accept', json={'savings': 2.5})
+    assert response.status_code == 200
+    assert response.get_json()['new_total_savings'] == 3.5
+
+
+def test_worker_stage_timings_reach_the_waiting_request(app):
+    from flask import g
+
+    def compute_many(types):
+        with app.instrumentation.stage('predict'):
+            return {t: [1.0] for t in types}
+
+    service = InferenceService(compute_many, batch_window_ms=1.0, instrumentation=app.instrumentation)
+    with app.app.test_request_context('/'):
+        app.instrumentation._before_request()
+        with app.instrumentation.stage('inference'):
+            assert service.forecast_many(['Oven', 'TV'], timeout=5) == {'Oven': [1.0], 'TV': [1.0]}
+        assert set(g._timings) == {'inference', 'predict'}
+        assert g._timings['predict'] <= g._timings['inference']
+
+
+def test_forecast_many_gives_up_after_one_deadline():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute_many(types):
+        calls.append(sorted(types))
+        started.set()
+        release.wait(5)
+        return {t: [1.0] for t in types}
+
+    service = InferenceService(compute_many, batch_window_ms=1.0)
+    blocker = service.submit('Oven')
+    assert started.wait(5)
+    began = time.monotonic()
+    with pytest.raises(InferenceTimeout) as raised:
+        service.forecast_many(['TV', 'Dishwasher', 'Microwave'], timeout=0.1)
+    # One deadline for the call, not one per type
+    assert time.monotonic() - began < 0.5
+    assert raised.value.results == {}
+    assert sorted(raised.value.pending) == ['Dishwasher', 'Microwave', 'TV']
+
+    release.set()
+    assert blocker.result(5) == [1.0]
+    assert service.forecast_many(['TV'], timeout=5) == {'TV': [1.0]}
+    # The abandoned types were cancelled while queued and never computed
+    assert calls == [['Oven'], ['TV']]
+
+
+def test_suggestions_report_timed_out_forecasts_as_json(app, client, monkeypatch, request):
+    infer_forecasts = app.infer_forecasts
+    user_id, appliance_ids = request.getfixturevalue('household')(2)
+    monkeypatch.setattr(app, 'infer_forecasts', infer_forecasts)
+    monkeypatch.setattr(app, 'load_stored_forecasts', lambda types: {})
+    release = threading.Event()
+    service = InferenceService(lambda types: release.wait(5) and {}, batch_window_ms=1.0)
+    monkeypatch.setattr(app, 'inference_service', service)
+    monkeypatch.setitem(app.app.config, 'INFERENCE_TIMEOUT', 0.05)
+    try:
+        response = client.get(f'/user/{user_id}/appliance/{appliance_ids[0]}/suggestion')
+        assert response.status_code == 500
+        assert response.get_json() == {'error': 'Could not retrieve forecast'}
+        response = client.get(f'/user/{user_id}/suggestions')
+        assert response.status_code == 200
+        assert all(item['error'] == 'Could not retrieve forecast' for item in response.get_json()['suggestions'])
+    finally:
+        release.set()
+
+
+@pytest.mark.parametrize('savings', ['NaN', 'Infinity', '-Infinity', '-1.5', '"lots"', 'null'])
+def test_accept_rejects_savings_that_are_not_a_finite_non_negative_number(client, household, savings):
+    household(1)
+    response = client.post('/suggestion/accept', data=f'{{"savings": {savings}}}', content_type='application/json')
+    assert response.status_code == 400
+    response = client.post('/suggestion/accept', json={'savings': 0.5})
+    assert response.get_json()['new_total_savings'] == 0.5
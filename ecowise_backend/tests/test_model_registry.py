@@ -0,0 +1,111 @@
+import os
+import shutil
+
+import pytest
+
+import model_registry
+from model_registry import ModelRegistry, publish, stamp_path
+
+
+class FileRegistry(ModelRegistry):
+    """Loads the raw contents of the model and scaler files, with a hook between the two reads."""
+
+    between_reads = None
+
+    def _load(self, appliance_key):
+        model_path, scaler_path = self.paths(appliance_key)
+        with open(model_path) as f:
+            model = f.read()
+        if self.between_reads:
+            self.between_reads()
+        with open(scaler_path) as f:
+            scaler = f.read()
+        return model, scaler, model_registry.load_metadata(self.model_dir, appliance_key)
+
+
+def save(model_dir, version):
+    replacements = []
+    for name in ('tv_model.h5', 'tv_scaler.pkl'):
+        path = os.path.join(model_dir, name)
+        with open(path + '.tmp', 'w') as f:
+            f.write(version)
+        replacements.append((path + '.tmp', path))
+    publish(model_dir, 'tv', replacements)
+
+
+def test_load_overlapping_a_swap_is_discarded(tmp_path):
+    save(tmp_path, 'v1')
+    registry = FileRegistry(str(tmp_path), check_interval=0)
+    assert registry.get('tv') == ('v1', 'v1')
+
+    save(tmp_path, 'v2')
+    registry.between_reads = lambda: save(tmp_path, 'v3')
+    # The v2 load read the model before and the scaler after v3 was published
+    assert registry.get('tv') == ('v1', 'v1')
+
+    registry.between_reads = None
+    assert registry.get('tv') == ('v3', 'v3')
+    assert registry.reloads == 1
+
+
+def test_version_is_kept_while_files_are_replaced(tmp_path):
+    save(tmp_path, 'v1')
+    registry = FileRegistry(str(tmp_path), check_interval=0)
+    assert registry.get('tv') == ('v1', 'v1')
+    signature = registry.signature('tv')
+
+    # publish() marks the stamp not ready before replacing any file
+    with open(stamp_path(str(tmp_path), 'tv'), 'w') as f:
+        f.write('{"version": null, "ready": false}')
+    with open(os.path.join(tmp_path, 'tv_scaler.pkl'), 'w') as f:
+        f.write('v2')
+    assert registry.signature('tv') == signature
+    assert registry.get('tv') == ('v1', 'v1')
+
+
+def test_stamp_abandoned_mid_swap_falls_back_to_file_times(tmp_path):
+    save(tmp_path, 'v1')
+    # A trainer died after marking the stamp not ready and replacing one file
+    path = stamp_path(str(tmp_path), 'tv')
+    with open(path, 'w') as f:
+        f.write('{"version": null, "ready": false}')
+    with open(os.path.join(tmp_path, 'tv_scaler.pkl'), 'w') as f:
+        f.write('v2')
+    registry = FileRegistry(str(tmp_path), check_interval=0)
+    assert registry.get('tv') == (None, None)
+
+    stale = os.stat(path).st_mtime - model_registry.STALE_STAMP_SECONDS - 1
+    os.utime(path, (stale, stale))
+    assert registry.get('tv') == ('v1', 'v2')
+    assert registry.version_tag('tv').count('/') == 1
+
+    save(tmp_path, 'v3')
+    assert registry.get('tv') == ('v3', 'v3')
+
+
+def test_models_without_a_stamp_use_file_times(tmp_path):
+    for name in ('tv_model.h5', 'tv_scaler.pkl'):
+        with open(os.path.join(tmp_path, name), 'w') as f:
+            f.write('v1')
+    registry = FileRegistry(str(tmp_path), check_interval=0)
+    assert registry.get('tv') == ('v1', 'v1')
+    assert registry.version_tag('tv').count('/') == 1
+    assert registry.get_with_metadata('tv')[2]['kind'] == model_registry.RECURSIVE
+
+
+def test_model_with_outputs_not_matching_its_metadata_is_not_loaded(tmp_path):
+    """A one-step model must not be served as a direct one, which would give a 1-hour forecast."""
+    pytest.importorskip('h5py')
+    pytest.importorskip('sklearn')
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ml', 'saved_model')
+    if not os.path.exists(os.path.join(source, 'tv_model.h5')):
+        pytest.skip("no saved models")
+    for name in ('tv_model.h5', 'tv_scaler.pkl'):
+        shutil.copy(os.path.join(source, name), tmp_path / name)
+    registry = ModelRegistry(str(tmp_path), backend='numpy', check_interval=0)
+    assert registry.get('tv')[0] is not None
+
+    with open(model_registry.metadata_path(str(tmp_path), 'tv'), 'w') as f:
+        f.write('{"kind": "direct", "horizon": 24}')
+    publish(str(tmp_path), 'tv', [])
+    assert registry.get('tv') == (None, None)
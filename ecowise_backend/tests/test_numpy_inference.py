@@ -0,0 +1,97 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip('h5py')
+from numpy_inference import ACTIVATIONS, NumpyForecaster, NumpyScaler, predict_many, rollout_many
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ml', 'saved_model')
+MODEL_PATHS = sorted(
+    os.path.join(MODEL_DIR, f) for f in os.listdir(MODEL_DIR) if f.endswith('_model.h5')
+) if os.path.isdir(MODEL_DIR) else []
+TOLERANCE = 1e-4
+
+pytestmark = pytest.mark.skipif(not MODEL_PATHS, reason="no saved models")
+
+
+def windows(forecaster, count=8, seed=0):
+    return np.random.default_rng(seed).random((count, forecaster.look_back, 1), dtype=np.float32)
+
+
+@pytest.mark.parametrize('path', MODEL_PATHS, ids=os.path.basename)
+def test_matches_keras(path):
+    """The NumPy forward pass, rollout and scaler agree with Keras and scikit-learn."""
+    keras = pytest.importorskip('tensorflow').keras
+    pytest.importorskip('sklearn')
+    keras_model = keras.models.load_model(path)
+    numpy_model = NumpyForecaster.from_h5(path)
+    batch = windows(numpy_model)
+
+    keras_output = keras_model.predict(batch, verbose=0)
+    np.testing.assert_allclose(numpy_model.predict(batch), keras_output, atol=TOLERANCE)
+
+    if numpy_model.output_size > 1:
+        # A direct model's forecast is its forward pass
+        np.testing.assert_allclose(numpy_model.forecast(batch), keras_output, atol=TOLERANCE)
+    else:
+        expected = []
+        current = batch[:1]
+        for _ in range(24):
+            pred = keras_model.predict(current, verbose=0)[0]
+            expected.append(pred[0])
+            current = np.append(current[:, 1:, :], [[pred]], axis=1)
+        np.testing.assert_allclose(numpy_model.rollout(batch[:1], 24)[0], expected, atol=TOLERANCE)
+
+    with open(path.replace('_model.h5', '_scaler.pkl'), 'rb') as f:
+        scaler = pickle.load(f)
+    raw = np.random.default_rng(1).random((24, 1)) * 50000
+    np.testing.assert_allclose(NumpyScaler.from_sklearn(scaler).transform(raw), scaler.transform(raw), atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('path', MODEL_PATHS, ids=os.path.basename)
+def test_rollout_matches_step_by_step(path):
+    """The shared-state rollout equals predicting one step at a time and sliding the window."""
+    model = NumpyForecaster.from_h5(path)
+    if model.output_size > 1:
+        pytest.skip("direct model")
+    batch = windows(model, count=3)
+    current = batch[:, :, 0]
+    expected = []
+    for _ in range(24):
+        step = model.predict(current[..., np.newaxis])[:, 0]
+        expected.append(step)
+        current = np.concatenate([current[:, 1:], step[:, np.newaxis]], axis=1)
+    np.testing.assert_allclose(model.rollout(batch, 24), np.stack(expected, axis=1), atol=TOLERANCE)
+
+
+def test_batched_models_match_one_by_one():
+    """Stacking several appliance types into one batch gives each its own result."""
+    models = [NumpyForecaster.from_h5(path) for path in MODEL_PATHS[:4]]
+    batch = np.concatenate([windows(m, count=1, seed=i) for i, m in enumerate(models)])
+    single = lambda run: np.concatenate([run([m], batch[i:i + 1]) for i, m in enumerate(models)])
+    np.testing.assert_allclose(predict_many(models, batch), single(predict_many), atol=TOLERANCE)
+    if all(m.output_size == 1 for m in models):
+        rollout = lambda ms, x: rollout_many(ms, x, 24)
+        np.testing.assert_allclose(rollout(models, batch), single(rollout), atol=TOLERANCE)
+
+
+def direct_model(horizon, seed, look_back=24, units=4):
+    rng = np.random.default_rng(seed)
+    weights = lambda *shape: rng.normal(scale=0.5, size=shape).astype(np.float32)
+    return NumpyForecaster([
+        {'type': 'lstm', 'kernel': weights(1, 4 * units), 'recurrent_kernel': weights(units, 4 * units),
+         'bias': weights(4 * units), 'activation': ACTIVATIONS['tanh'], 'recurrent_activation': ACTIVATIONS['sigmoid']},
+        {'type': 'dense', 'kernel': weights(units, horizon), 'bias': weights(horizon), 'activation': ACTIVATIONS['linear']},
+    ], look_back)
+
+
+def test_direct_models_with_different_horizons_share_a_batch():
+    """Rows are cut to the shortest horizon instead of failing the batch."""
+    models = [direct_model(24, 0), direct_model(48, 1), direct_model(24, 2)]
+    batch = np.concatenate([windows(m, count=1, seed=i) for i, m in enumerate(models)])
+    result = predict_many(models, batch)
+    assert result.shape == (3, 24)
+    for i, m in enumerate(models):
+        np.testing.assert_allclose(result[i], m.predict(batch[i:i + 1])[0, :24], atol=TOLERANCE)
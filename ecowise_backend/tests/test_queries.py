@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def queries_for(app, client, method, url, body=None):
+    """Runs one request with cold caches and returns (status, statements)."""
+    app.forecast_cache.invalidate()
+    app.catalog_cache.invalidate()
+    with app.app.app_context():
+        engine = app.db.engine
+    with count_queries(engine) as statements:
+        response = getattr(client, method)(url, json=body)
+    return response.status_code, statements
+
+
+# (method, url, body, status, queries); {user} and {appliance} are filled in
+# per household. Each count is the most the endpoint may issue: one for the
+# session's user, one per table it reads, one per write, and a single stored
+# forecast lookup for all appliance types together.
+ENDPOINTS = [
+    ('get', '/@me', None, 200, 1),
+    ('get', '/user/{user}', None, 200, 2),
+    ('get', '/user/{user}/stats', None, 200, 2),
+    ('get', '/appliances', None, 200, 2),
+    ('get', '/appliances?limit=2', None, 200, 2),
+    ('get', '/user/{user}/appliance/{appliance}/suggestion', None, 200, 4),
+    ('get', '/user/{user}/suggestions', None, 200, 3),
+    ('get', '/user/{user}/schedule', None, 200, 3),
+    ('post', '/suggestion/accept', {'savings': 3.5}, 200, 2),
+    ('delete', '/user/{user}/appliance/{appliance}', None, 200, 3),
+    ('post', '/register', {'username': 'newcomer', 'password': 'secret'}, 201, 2),
+    ('post', '/login', {'username': 'user5', 'password': 'secret'}, 200, 1),
+    ('post', '/logout', None, 200, 0),
+]
+
+
+@pytest.mark.parametrize('method, url, body, status, queries', ENDPOINTS, ids=[f'{m} {u}' for m, u, *_ in ENDPOINTS])
+def test_endpoint_query_count(app, client, household, method, url, body, status, queries):
+    user_id, appliance_ids = household(5)
+    url = url.format(user=user_id, appliance=appliance_ids[0])
+    code, statements = queries_for(app, client, method, url, body)
+    assert code == status
+    assert len(statements) <= queries, '\n'.join(statements)
+
+
+@pytest.mark.parametrize('url', ['/user/{user}/stats', '/user/{user}/suggestions', '/user/{user}/schedule', '/appliances'])
+def test_query_count_does_not_grow_with_appliances(app, client, household, url):
+    counts = []
+    for count in (5, 40):
+        user_id, _ = household(count)
+        code, statements = queries_for(app, client, 'get', url.format(user=user_id))
+        assert code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_add_user_appliance_inserts_once(app, client, household):
+    user_id, appliance_ids = household(5)
+    client.delete(f'/user/{user_id}/appliance/{appliance_ids[0]}')
+    code, statements = queries_for(app, client, 'post', f'/user/{user_id}/appliance', {'appliance_id': appliance_ids[0]})
+    assert code == 201
+    assert len(statements) <= 3
+    code, statements = queries_for(app, client, 'post', f'/user/{user_id}/appliance', {'appliance_id': appliance_ids[0]})
+    assert code == 200
+    assert len(statements) <= 3
+    with app.app.app_context():
+        assert len(app.repository.get_user_appliances(user_id)) == 5
@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+import pytest
+
+from timeseries_store import TimeSeriesStore
+
+pytest.importorskip('pandas')
+
+HEADER = 'Datetime,Appliance,PowerConsumption\n'
+
+
+def reading(hour, appliance='Oven', power=1.0):
+    return {'Datetime': f'2024-01-01 {hour:02d}:00:00', 'Appliance': appliance, 'PowerConsumption': power}
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'power.csv'
+    path.write_text(HEADER + ''.join(f'2024-01-01 {h:02d}:00:00,Oven,{h}\n' for h in range(3)))
+    return str(path)
+
+
+def test_blocked_append_does_not_hold_up_readers(csv_path):
+    fcntl = pytest.importorskip('fcntl')
+    store = TimeSeriesStore(csv_path).load()
+    with open(csv_path, 'ab') as other_process:
+        # Another writer holds the file lock, so the append waits for it
+        fcntl.flock(other_process.fileno(), fcntl.LOCK_EX)
+        other_process.write(b'2024-01-01 03:00:00,Oven,3\n')
+        other_process.flush()
+        result = {}
+        writer = threading.Thread(target=lambda: result.update(r=store.append_new_readings([reading(5), reading(4)])))
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+        reader = threading.Thread(target=store.refresh)
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+        assert len(store.values('Oven')) == 4
+    writer.join(5)
+    assert result['r'] == ([1, 0], [], [])
+    assert list(store.values('Oven')) == [0, 1, 2, 3, 1, 1]
+
+
+def test_append_new_readings_classifies_by_the_stored_series(csv_path):
+    store = TimeSeriesStore(csv_path).load()
+    appended, duplicates, stale = store.append_new_readings(
+        [reading(4), reading(1), reading(6, 'TV'), reading(4), reading(3)])
+    assert (appended, duplicates, stale) == ([4, 0, 2], [1, 3], [])
+    assert np.all(np.diff(store.times('Oven')) > np.timedelta64(0))
+    late = {**reading(2), 'Datetime': '2024-01-01 02:30:00'}
+    assert store.append_new_readings([reading(3, power=9.0), late]) == ([], [0], [1])
+    # Another store on the same file sees the appended rows
+    other = TimeSeriesStore(csv_path).load()
+    assert list(other.values('Oven')) == list(store.values('Oven'))
+    assert list(other.values('TV')) == [1.0]
+
+
+def test_snapshot_is_reused_only_for_the_csv_it_was_built_from(csv_path, tmp_path):
+    snapshot = str(tmp_path / 'snapshot')
+    with open(csv_path, 'a') as f:
+        f.write('2024-01-01 00:00:00,TV,5\n')
+    TimeSeriesStore(csv_path).load().save(snapshot)
+
+    with open(csv_path, 'a') as f:
+        f.write('2024-01-01 03:00:00,Oven,3\n')
+    store = TimeSeriesStore(csv_path, mmap_dir=snapshot).load()
+    assert isinstance(store.values('TV').base, np.memmap)
+    assert list(store.values('Oven')) == [0, 1, 2, 3]
+
+    # Replaced by a different file at least as long: the snapshot is stale
+    with open(csv_path, 'w') as f:
+        f.write(HEADER + ''.join(f'2024-02-01 {h:02d}:00:00,Oven,{h + 10}\n' for h in range(5)))
+    store = TimeSeriesStore(csv_path, mmap_dir=snapshot).load()
+    assert list(store.values('Oven')) == [10, 11, 12, 13, 14]
+    assert list(store.values('TV')) == []
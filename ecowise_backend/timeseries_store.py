@@ -0,0 +1,373 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+# Columns of the consumption dataset that the store keeps in memory
+APPLIANCE_COLUMN = 'Appliance'
+DATETIME_COLUMN = 'Datetime'
+VALUE_COLUMN = 'PowerConsumption'
+
+logger = logging.getLogger(__name__)
+
+
+class ApplianceSeries:
+    """
+    One appliance type's readings as contiguous arrays: float32 power values and
+    a datetime64 index. The arrays are over-allocated so appends are amortised
+    O(1), and `times`/`values` return views of the filled part without copying.
+    """
+
+    def __init__(self, times, values):
+        self._times = times
+        self._values = values
+        self.length = len(values)
+
+    @property
+    def times(self):
+        return self._times[:self.length]
+
+    @property
+    def values(self):
+        return self._values[:self.length]
+
+    def append(self, times, values):
+        needed = self.length + len(values)
+        if needed > len(self._values) or not self._values.flags.writeable:
+            # Grow geometrically; this also copies memory-mapped (read-only) data
+            # into a private buffer the first time new rows arrive.
+            capacity = max(needed, 2 * len(self._values), 64)
+            new_times = np.empty(capacity, dtype='datetime64[ns]')
+            new_values = np.empty(capacity, dtype=np.float32)
+            new_times[:self.length] = self.times
+            new_values[:self.length] = self.values
+            self._times, self._values = new_times, new_values
+        self._times[self.length:needed] = times
+        self._values[self.length:needed] = values
+        self.length = needed
+
+
+class TimeSeriesStore:
+    """
+    Loads the power consumption CSV once and keeps it partitioned by appliance
+    type, so forecasting, seeding and training no longer re-read and filter the
+    whole file.
+
+    `refresh()` picks up rows appended to the CSV since the last load by parsing
+    only the new bytes; a file that shrank is reloaded from scratch. A snapshot
+    can be written with `save()` and reopened memory-mapped, which lets worker
+    processes share the same pages instead of each holding its own copy.
+    """
+
+    def __init__(self, path, mmap_dir=None):
+        self.path = path
+        self.mmap_dir = mmap_dir
+        self.generation = 0
+        self._series = {}
+        self._columns = None
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()  # serialises this process's appends; readers never take it
+
+    # --- Loading ---
+
+    def load(self):
+        """Loads the dataset, preferring an up-to-date memory-mapped snapshot."""
+        with self._lock:
+            self._series = {}
+            self._offset = 0
+            self.generation += 1
+            if self.mmap_dir and self._open_snapshot():
+                self.refresh()
+                return self
+            if not os.path.exists(self.path):
+                logger.warning("Dataset not found at %s.", self.path)
+                return self
+            with open(self.path, 'rb') as f:
+                header = f.readline()
+                self._columns = header.decode('utf-8').strip().split(',')
+                self._offset = len(header)
+                self._append_bytes(f.read())
+            return self
+
+    def refresh(self):
+        """
+        Appends rows added to the CSV since the last load. Returns True when
+        anything changed.
+
+        New bytes are read and parsed without holding the store's lock, which
+        is only taken to install the parsed rows, so readers are not held up
+        by a large append. If another thread installed the same bytes first,
+        the parse is discarded and the rest of the file is picked up again.
+        """
+        changed = False
+        while True:
+            with self._lock:
+                columns, offset, generation = self._columns, self._offset, self.generation
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                return changed
+            if columns is None or size < offset:
+                self.load()
+                return True
+            if size == offset:
+                return changed
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            # Only complete lines are consumed, so a row that is still being
+            # written is picked up next time
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                return changed
+            parsed = self._prepare(self._parse(data[:end], columns))
+            with self._lock:
+                if self._offset != offset or self.generation != generation:
+                    continue
+                self._offset += end
+                self._install(parsed)
+            changed = changed or bool(parsed)
+
+    def append_new_readings(self, rows):
+        """
+        Appends, in time order, the readings that are newer than the last
+        stored reading of their appliance type, so each series stays sorted.
+        `rows` are dicts keyed by column name; missing columns are written
+        empty. Other processes sharing the file see the rows on their next
+        refresh. Returns the indices into `rows` of the (appended, duplicate, stale)
+        readings: a duplicate's appliance type and time are already stored, a
+        stale reading is older than the series' last one but not stored.
+
+        The check runs under the file lock after picking up rows appended by
+        other processes, so concurrent writers cannot interleave out of order.
+        """
+        appended, duplicates, stale = [], [], []
+        if not rows:
+            return appended, duplicates, stale
+        if self._columns is None:
+            self.load()
+        # Only the file lock is held while checking and writing; the store's
+        # own lock is taken by refresh() just to install parsed rows.
+        with self._write_lock, open(self.path, 'ab') as f:
+            _lock_file(f)
+            self.refresh()
+            times = [np.datetime64(row[DATETIME_COLUMN], 'ns') for row in rows]
+            last = {}
+            for i in sorted(range(len(rows)), key=times.__getitem__):
+                appliance_type = rows[i][APPLIANCE_COLUMN]
+                stored = self.times(appliance_type)
+                if appliance_type not in last:
+                    last[appliance_type] = stored[-1] if len(stored) else None
+                if last[appliance_type] is None or times[i] > last[appliance_type]:
+                    appended.append(i)
+                    last[appliance_type] = times[i]
+                elif times[i] == last[appliance_type] or _contains(stored, times[i]):
+                    duplicates.append(i)
+                else:
+                    stale.append(i)
+            if appended:
+                self._write_rows(f, [rows[i] for i in appended])
+                self.refresh()
+        return appended, duplicates, stale
+
+    def _write_rows(self, out, rows):
+        # `out` is the CSV opened for appending, with the file lock held
+        columns = self._columns
+        lines = []
+        for row in rows:
+            fields = ('' if row.get(c) is None else str(row[c]) for c in columns)
+            lines.append(','.join(_csv_field(f) for f in fields))
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        # The bundled CSV has no trailing newline; don't glue a row onto its last line
+        if out.tell() > 0:
+            with open(self.path, 'rb') as tail:
+                tail.seek(-1, os.SEEK_END)
+                if tail.read(1) != b'\n':
+                    data = b'\n' + data
+        out.write(data)
+        out.flush()
+
+    def _append_bytes(self, data):
+        # Used by a full load, with the store's lock held; it also takes the
+        # final line, since the bundled CSV has no trailing newline.
+        if not data:
+            return False
+        self._offset += len(data)
+        parsed = self._prepare(self._parse(data, self._columns))
+        self._install(parsed)
+        return bool(parsed)
+
+    def _parse(self, data, columns):
+        import pandas as pd
+        df = pd.read_csv(io.BytesIO(data), header=None, names=columns)
+        return df.dropna(subset=[APPLIANCE_COLUMN])
+
+    def _prepare(self, df):
+        """Splits parsed rows into [(appliance_type, times, values)]."""
+        if df.empty:
+            return []
+        times = _to_datetime64(df[DATETIME_COLUMN])
+        values = df[VALUE_COLUMN].to_numpy(dtype=np.float32)
+        # groupby(sort=False) keeps appliance types in order of first appearance
+        # and each group's rows in file order.
+        return [(appliance_type, times[idx], values[idx])
+                for appliance_type, idx in df.groupby(APPLIANCE_COLUMN, sort=False).indices.items()]
+
+    def _install(self, parsed):
+        # Called with the store's lock held
+        for appliance_type, times, values in parsed:
+            series = self._series.get(appliance_type)
+            if series is None:
+                self._series[appliance_type] = ApplianceSeries(times, values)
+            else:
+                series.append(times, values)
+
+    # --- Queries ---
+
+    def appliance_types(self):
+        return list(self._series)
+
+    def version(self, appliance_type):
+        """Changes whenever readings for this appliance type change."""
+        series = self._series.get(appliance_type)
+        return (self.generation, series.length if series is not None else 0)
+
+    def values(self, appliance_type):
+        series = self._series.get(appliance_type)
+        return series.values if series is not None else np.empty(0, dtype=np.float32)
+
+    def times(self, appliance_type):
+        series = self._series.get(appliance_type)
+        return series.times if series is not None else np.empty(0, dtype='datetime64[ns]')
+
+    def last(self, appliance_type, n):
+        """Returns a view of the last `n` readings for an appliance type."""
+        values = self.values(appliance_type)
+        return values[-n:] if n else values[:0]
+
+    def mean(self, appliance_type):
+        values = self.values(appliance_type)
+        return float(values.mean(dtype=np.float64)) if len(values) else None
+
+    # --- Memory-mapped snapshots ---
+
+    def save(self, directory=None):
+        """Writes the store as .npy files plus an index, for `mmap_dir` loading."""
+        directory = directory or self.mmap_dir
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            index = {
+                'source_size': self._offset,
+                'columns': self._columns,
+                'series': {},
+            }
+            for i, (appliance_type, series) in enumerate(self._series.items()):
+                stem = f"series_{i}"
+                _save_npy(os.path.join(directory, f"{stem}.values.npy"), series.values)
+                _save_npy(os.path.join(directory, f"{stem}.times.npy"), series.times)
+                index['series'][appliance_type] = stem
+        # Identifies the bytes the snapshot was built from, so it is not
+        # reused for a CSV that was replaced rather than appended to
+        index['source_mtime_ns'], index['source_sha256'] = _source_identity(self.path, index['source_size'])
+        tmp_path = os.path.join(directory, 'index.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(directory, 'index.json'))
+
+    def _open_snapshot(self):
+        index_path = os.path.join(self.mmap_dir, 'index.json')
+        if not os.path.exists(index_path):
+            return False
+        with open(index_path) as f:
+            index = json.load(f)
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            st = None  # serve the snapshot without its source
+        if st is not None:
+            if st.st_size < index['source_size'] or index.get('source_sha256') is None:
+                return False
+            # An untouched file is trusted by its mtime; one that changed must
+            # still start with the bytes the snapshot was built from
+            unchanged = st.st_size == index['source_size'] and st.st_mtime_ns == index.get('source_mtime_ns')
+            if not unchanged and _prefix_sha256(self.path, index['source_size']) != index['source_sha256']:
+                logger.info("Snapshot in %s does not match %s; reloading from the CSV", self.mmap_dir, self.path)
+                return False
+        self._columns = index['columns']
+        self._offset = index['source_size']
+        for appliance_type, stem in index['series'].items():
+            values = np.load(os.path.join(self.mmap_dir, f"{stem}.values.npy"), mmap_mode='r')
+            times = np.load(os.path.join(self.mmap_dir, f"{stem}.times.npy"), mmap_mode='r')
+            self._series[appliance_type] = ApplianceSeries(times, values)
+        return True
+
+
+def _csv_field(value):
+    if any(c in value for c in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _contains(sorted_times, value):
+    i = np.searchsorted(sorted_times, value)
+    return i < len(sorted_times) and sorted_times[i] == value
+
+
+def _lock_file(f):
+    # Serialises appends from several processes; released when the file closes
+    try:
+        import fcntl
+    except ImportError:
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _to_datetime64(column):
+    import pandas as pd
+    return pd.to_datetime(column).to_numpy(dtype='datetime64[ns]')
+
+
+def _prefix_sha256(path, size):
+    """SHA-256 of the first `size` bytes of the file; None if it is shorter."""
+    digest = hashlib.sha256()
+    remaining = size
+    with open(path, 'rb') as f:
+        while remaining:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                return None
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _source_identity(path, size):
+    """(mtime_ns, prefix hash) of the source CSV; the mtime only if `size` is the whole file."""
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns if st.st_size == size else None), _prefix_sha256(path, size)
+    except OSError:
+        return None, None
+
+
+def _save_npy(path, array):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+if __name__ == '__main__':
+    # Writes a memory-mapped snapshot of the bundled dataset, e.g.
+    #   python timeseries_store.py instance/timeseries
+    import sys
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(basedir, 'instance', 'timeseries')
+    store = TimeSeriesStore(os.path.join(basedir, 'data', 'power_consumption.csv')).load()
+    store.save(target)
+    print(f"Saved {len(store.appliance_types())} appliance series to {target}")
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionedCache:
+    """
+    Caches computed values, e.g. 24-hour forecasts per appliance type or
+    rendered catalog pages.
+
+    Entries are keyed by (key, version), where the version identifies what the
+    value was computed from, such as the dataset and model files behind a
+    forecast; storing a new version of a key drops the older ones. An entry
+    expires after `ttl` seconds, and the least recently used entries are
+    evicted once more than `max_entries` are held. Concurrent misses for the
+    same entry wait for a single computation instead of each running it.
+    """
+
+    def __init__(self, ttl=900, max_entries=128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # (key, version) -> (expires_at, value)
+        self._in_flight = {}  # (key, version) -> threading.Event
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, version, compute):
+        """
+        Returns the cached value for (key, version), calling `compute()` to
+        produce it on a miss. Failed computations (None) are not cached, so
+        the next request retries.
+        """
+        entry_key = (key, version)
+        while True:
+            with self._lock:
+                entry = self._entries.get(entry_key)
+                if entry is not None and entry[0] > time.monotonic():
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return entry[1]
+                if entry is not None:
+                    del self._entries[entry_key]
+                waiter = self._in_flight.get(entry_key)
+                if waiter is None:
+                    # This thread owns the computation for this entry
+                    self.misses += 1
+                    waiter = self._in_flight[entry_key] = threading.Event()
+                    break
+            # Another thread is already computing this entry; wait and re-check
+            waiter.wait()
+
+        value = None
+        try:
+            value = compute()
+        finally:
+            with self._lock:
+                if value is not None:
+                    self._store(entry_key, value)
+                del self._in_flight[entry_key]
+            waiter.set()
+        return value
+
+    def get_or_compute_many(self, versions, compute_many):
+        """
+        Batched form of `get_or_compute`. `versions` maps key to version;
+        `compute_many(keys)` is called once with every key that missed and no
+        other thread is already computing, and must return a dict of
+        key -> value. Returns a dict of key -> value (or None).
+        """
+        results, owned, waiting = {}, {}, {}
+        with self._lock:
+            now = time.monotonic()
+            for key, version in versions.items():
+                entry_key = (key, version)
+                entry = self._entries.get(entry_key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    results[key] = entry[1]
+                elif entry_key in self._in_flight:
+                    waiting[key] = self._in_flight[entry_key]
+                else:
+                    self.misses += 1
+                    owned[key] = self._in_flight[entry_key] = threading.Event()
+
+        if owned:
+            computed = {}
+            try:
+                computed = compute_many(list(owned))
+            finally:
+                with self._lock:
+                    for key, waiter in owned.items():
+                        entry_key = (key, versions[key])
+                        value = computed.get(key)
+                        if value is not None:
+                            self._store(entry_key, value)
+                        del self._in_flight[entry_key]
+                        waiter.set()
+            for key in owned:
+                results[key] = computed.get(key)
+
+        for key, waiter in waiting.items():
+            waiter.wait()
+            # Picks up the other thread's result, or retries if it failed
+            results[key] = self.get_or_compute(
+                key, versions[key],
+                lambda key=key: compute_many([key]).get(key))
+        return results
+
+    def _store(self, entry_key, value):
+        # Drop any entries for older versions of the same key
+        for stale in [k for k in self._entries if k[0] == entry_key[0] and k != entry_key]:
+            del self._entries[stale]
+        self._entries[entry_key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(entry_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Removes every version of one key, or all entries."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                return
+            for entry_key in [k for k in self._entries if k[0] == key]:
+                del self._entries[entry_key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+            }